@@ -2,11 +2,13 @@
 
 from google.adk.agents import LlmAgent, SequentialAgent
 from google.adk.tools import google_search
-from .calendar_tool import manage_lesson_event
+from .history_manager import compact_history
+from app.llm import adk_model
 
 chat_agent = LlmAgent(
     name="chat_agent",
-    model="gemini-2.5-pro",
+    model=adk_model("chat"),
+    before_model_callback=compact_history,
     tools=[google_search],
     instruction="""
 Inputs in context.state:
@@ -24,7 +26,8 @@ Write a helpful, concise reply.  Output only the reply text.
 # ─── Explanation Agent ───────────────────────────────────────────────────────────
 explanation_agent = LlmAgent(
     name="explanation_agent",
-    model="gemini-2.5-pro",
+    model=adk_model("explanation"),
+    before_model_callback=compact_history,
     tools=[google_search],
     instruction="""
 Inputs in context.state:
@@ -45,7 +48,8 @@ Output only the explanation text.
 # ─── Story Agent ─────────────────────────────────────────────────────────────────
 story_agent = LlmAgent(
     name="story_agent",
-    model="gemini-2.5-pro",
+    model=adk_model("story"),
+    before_model_callback=compact_history,
     tools=[google_search],
     instruction="""
 Inputs in context.state:
@@ -66,7 +70,8 @@ Output only the story text.
 # ─── Quiz Agent ──────────────────────────────────────────────────────────────────
 quiz_agent = LlmAgent(
     name="quiz_agent",
-    model="gemini-2.5-pro",
+    model=adk_model("quiz"),
+    before_model_callback=compact_history,
     instruction="""
 Inputs in context.state:
 - history: list of {sender,text}
@@ -93,7 +98,8 @@ Output plain text:
 # ─── Lesson Plan Agent ───────────────────────────────────────────────────────────
 lesson_plan_agent = LlmAgent(
     name="lesson_plan_agent",
-    model="gemini-2.5-pro",
+    model=adk_model("lesson_plan"),
+    before_model_callback=compact_history,
     tools=[google_search],
     instruction="""
 Inputs in context.state:
@@ -113,32 +119,11 @@ Output only the outline text.
     output_key="lesson_text"
 )
 
-# ─── Calendar Agent ──────────────────────────────────────────────────────────────
-calendar_agent = LlmAgent(
-    name="calendar_agent",
-    model="gemini-2.5-pro",
-    tools=[manage_lesson_event],  # ADK auto-wraps as a Function Tool
-    instruction="""
-Inputs in context.state:
-- history: list of {sender,text}
-- topic: string
-- grades: list of ints
-- date: string (YYYY-MM-DD)
-- lesson_text: string
-
-TASK:
-Call manage_lesson_event(date, topic,
-    description="Lesson for grades {grades} on {topic}",
-    attachment_content=lesson_text)
-Parse the returned dict and output ONLY the "message" field.
-""",
-    output_key="cal_text"
-)
-
 # ─── Game Agent ─────────────────────────────────────────────────────────────────
 game_agent = LlmAgent(
     name="game_agent",
-    model="gemini-2.5-pro",
+    model=adk_model("game"),
+    before_model_callback=compact_history,
     tools=[google_search],
     instruction="""
 Inputs in context.state:
@@ -159,7 +144,8 @@ Output only the game description.
 # ─── Reflect Agent ──────────────────────────────────────────────────────────────
 reflect_agent = LlmAgent(
     name="reflect_agent",
-    model="gemini-2.5-pro",
+    model=adk_model("reflect"),
+    before_model_callback=compact_history,
     tools=[google_search],
     instruction="""
 Inputs in context.state:
@@ -190,7 +176,7 @@ ask_quiz_seq = SequentialAgent(
 )
 ask_lesson_seq = SequentialAgent(
     name="ask_lesson_seq",
-    sub_agents=[lesson_plan_agent, calendar_agent]
+    sub_agents=[lesson_plan_agent]  # calendar/Drive runs in calendar_jobs
 )
 ask_game_seq = SequentialAgent(
     name="ask_game_seq",
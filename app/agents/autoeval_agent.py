@@ -2,35 +2,177 @@
 
 import os
 import json
-import re
-from typing import List
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
 
-import vertexai
-from vertexai.preview.generative_models import GenerativeModel
-from google.cloud import vision
+from app import metrics
+from app.llm import generate, json_config
+from . import pregrader
+from .ocr import ocr_images_to_text
 
-# ─── Vertex AI & Vision Initialization ───────────────────────────────────────
-vertexai.init(
-    project=os.environ["GOOGLE_CLOUD_PROJECT"],
-    location=os.environ["GOOGLE_CLOUD_LOCATION"],
-)
-_gemini = GenerativeModel("gemini-2.5-pro")
-_vision = vision.ImageAnnotatorClient()
+logger = logging.getLogger("app.agents.autoeval_agent")
 
+# Students graded per model call; they share one copy of the answer key.
+STUDENTS_PER_PROMPT = int(os.getenv("AUTOEVAL_STUDENTS_PER_PROMPT", "5"))
 
-def ocr_images_to_text(image_bytes_list: List[bytes]) -> List[str]:
+_DETAIL_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "question": {"type": "INTEGER"},
+        "correct": {"type": "BOOLEAN"},
+        "student": {"type": "STRING"},
+        "feedback": {"type": "STRING"},
+    },
+    "required": ["question", "correct", "student", "feedback"],
+}
+_BATCH_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "results": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "id": {"type": "STRING"},
+                    "details": {"type": "ARRAY", "items": _DETAIL_SCHEMA},
+                },
+                "required": ["id", "details"],
+            },
+        },
+    },
+    "required": ["results"],
+}
+
+# answers marked by the pre-grader vs. sent to the model
+_stats = {"students": 0, "local": 0, "model": 0, "model_calls": 0}
+_stats_lock = threading.Lock()
+
+
+def _metrics() -> dict:
+    with _stats_lock:
+        snap = dict(_stats)
+    total = snap["local"] + snap["model"]
+    snap["local_rate"] = round(snap["local"] / total, 4) if total else 0.0
+    return snap
+
+
+metrics.register("autoeval", _metrics)
+
+
+def _score(details: list) -> int:
+    return sum(1 for d in details if d.get("correct"))
+
+
+def _pregrade(correct_answers: List[str], text: str) -> Tuple[Dict[int, dict], Optional[Dict[int, str]]]:
     """
-    Perform OCR on each image and return a list of text pages.
+    Marks what can be judged locally. Returns the local details by question
+    and the answers still to be graded by the model ({question: answer}),
+    or None for the latter when the sheet could not be segmented and the
+    model has to read all of it.
+
+    Only a clean one-line answer is marked locally; one spread over several
+    lines (working) goes to the model. If any question has no answer found,
+    the segmentation is suspect and the model reads the whole sheet.
+    """
+    answers = pregrader.segment(text, len(correct_answers))
+    if answers is None or any(not answers.get(q, "").strip() for q in range(1, len(correct_answers) + 1)):
+        return {}, None
+    local, pending = {}, {}
+    for q, key in enumerate(correct_answers, start=1):
+        got = answers.get(q, "")
+        verdict = pregrader.match(key, got) if "\n" not in got else None
+        if verdict is None:
+            pending[q] = " / ".join(got.splitlines())
+        else:
+            local[q] = {
+                "question": q,
+                "correct": verdict,
+                "student": got,
+                "feedback": "Correct." if verdict else f"Expected: {key}.",
+            }
+    return local, pending
+
+
+def _grade_remaining(correct_answers: List[str], todo: List[Tuple[str, Optional[Dict[int, str]]]], texts: dict) -> dict:
     """
-    pages: List[str] = []
-    for img_bytes in image_bytes_list:
-        image = vision.Image(content=img_bytes)
-        resp = _vision.text_detection(image=image)
-        if resp.error.message:
-            raise RuntimeError(f"Vision API error: {resp.error.message}")
-        text = resp.full_text_annotation.text or ""
-        pages.append(text.strip())
-    return pages
+    One Gemini call for every student's unresolved questions.
+    Returns {student_id: [detail]}.
+    """
+    num_qs = len(correct_answers)
+    blocks, asked = [], set()
+    for sid, pending in todo:
+        if pending is None:
+            asked.update(range(1, num_qs + 1))
+            blocks.append(
+                f'--- Student "{sid}": grade questions 1–{num_qs} (extracted answers, one per line) ---\n{texts[sid]}'
+            )
+        else:
+            asked.update(pending)
+            lines = "\n".join(f"{q}: {a}" for q, a in sorted(pending.items()))
+            blocks.append(f'--- Student "{sid}": grade questions {", ".join(map(str, sorted(pending)))} ---\n{lines}')
+    key = {q: correct_answers[q - 1] for q in sorted(asked)}
+    sheets = "\n\n".join(blocks)
+    prompt = f"""
+You are an expert grading assistant. Here are the correct answers, by question number:
+{json.dumps(key, ensure_ascii=False)}
+
+Grade each of the following {len(todo)} student answer sheets independently.
+Only the listed questions need grading; accept answers that mean the same
+as the correct answer even if worded differently.
+
+{sheets}
+
+For every student, return an entry in "results" with "id" set to the
+student's id exactly as given, and "details" holding one entry per listed
+question: the question number, whether it is correct, the student's answer
+as read from the sheet, and short feedback.
+"""
+    response = generate("autoeval", prompt, generation_config=json_config(_BATCH_SCHEMA))
+    return {r["id"]: r["details"] for r in json.loads(response.text)["results"]}
+
+
+def grade_students(correct_answers: List[str], students: List[Tuple[str, str]]) -> List[dict]:
+    """
+    Grades several students' OCR'd answer sheets against one answer key.
+    Objective answers (exact, MCQ letter, numeric, one-letter typo) are marked
+    locally; whatever is left for all students goes to Gemini in a single
+    call. `students` is [(student_id, text)]; returns
+    [{"student", "score", "details"}] in the same order.
+    """
+    num_qs = len(correct_answers)
+    texts = dict(students)
+    local, todo = {}, []
+    for sid, text in students:
+        local[sid], pending = _pregrade(correct_answers, text)
+        if pending is None or pending:
+            todo.append((sid, pending))
+
+    by_id = _grade_remaining(correct_answers, todo, texts) if todo else {}
+    asked = dict(todo)
+    n_local = sum(len(d) for d in local.values())
+    n_model = sum(num_qs if p is None else len(p) for p in asked.values())
+    with _stats_lock:
+        _stats["students"] += len(students)
+        _stats["local"] += n_local
+        _stats["model"] += n_model
+        _stats["model_calls"] += 1 if todo else 0
+    logger.debug("📝 %d students: %d answers marked locally, %d by the model", len(students), n_local, n_model)
+
+    out = []
+    for sid, _ in students:
+        details = dict(local[sid])
+        if sid in asked:
+            if sid not in by_id:
+                raise RuntimeError(f"No grading returned for student {sid!r}")
+            wanted = asked[sid]
+            for d in by_id[sid]:
+                q = d.get("question", 0)
+                if wanted is None or q in wanted:
+                    details[q] = d
+        details = [details[q] for q in sorted(details)]
+        out.append({"student": sid, "score": _score(details), "details": details})
+    return out
 
 
 def run_autoeval_pipeline(
@@ -39,7 +181,8 @@ def run_autoeval_pipeline(
 ) -> dict:
     """
     Given the correct answer list and a list of student answer-sheet images,
-    OCRs the images, then uses Gemini 2.5 Pro to grade and provide feedback.
+    OCRs the images, then grades them (locally where possible, otherwise
+    with Gemini) and provides feedback.
 
     Returns a dict:
     {
@@ -50,54 +193,10 @@ def run_autoeval_pipeline(
            "student": str,
            "feedback": str
          },
-         …  
+         …
       ]
     }
     """
-    # 1) OCR
-    student_pages = ocr_images_to_text(image_bytes_list)
-    student_blob = "\n".join(student_pages)
-
-    # 2) Build the LLM prompt
-    num_qs = len(correct_answers)
-    prompt = f"""
-You are an expert grading assistant. Here are the correct answers for questions 1–{num_qs}:
-{json.dumps(correct_answers, ensure_ascii=False)}
-
-The student's extracted answers (one per line) are:
-{student_blob}
-
-Please return a JSON object, NO extra text, exactly in this format:
-
-{{
-  "score": 0,
-  "details": [
-    {{
-      "question": 1,
-      "correct": true,
-      "student": "...",
-      "feedback": "..."
-    }},
-    // …one entry per question
-  ]
-}}
-"""
-    # 3) Invoke Gemini
-    response = _gemini.generate_content(prompt)
-    raw = response.text.strip()
-
-    # 4) Extract & parse JSON
-    cleaned = raw
-    if cleaned.startswith("```"):
-        cleaned = re.sub(r"^```[\w-]*\n", "", cleaned)
-        cleaned = re.sub(r"\n```$", "", cleaned)
-    try:
-        result = json.loads(cleaned)
-    except json.JSONDecodeError:
-        m = re.search(r"(\{.*\})", cleaned, re.DOTALL)
-        if m:
-            result = json.loads(m.group(1))
-        else:
-            raise RuntimeError(f"Failed to parse JSON from LLM response:\n{cleaned}")
-
-    return result
+    student_blob = "\n".join(ocr_images_to_text(image_bytes_list))
+    result = grade_students(correct_answers, [("student", student_blob)])[0]
+    return {"score": result["score"], "details": result["details"]}
@@ -0,0 +1,137 @@
+# app/agents/calendar_jobs.py
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+from datetime import date as dt_date
+from collections import OrderedDict
+
+from google.cloud import firestore
+
+from app.concurrency import run_blocking
+from .calendar_tool import manage_lesson_event
+
+logger = logging.getLogger("app.agents.calendar_jobs")
+
+WORKERS = int(os.getenv("CALENDAR_WORKERS", "2"))
+MAX_ATTEMPTS = int(os.getenv("CALENDAR_MAX_ATTEMPTS", "3"))
+MAX_JOBS = 5000  # finished jobs kept in memory for polling
+
+
+class CalendarJobs:
+    """
+    Background queue for the Drive upload + Calendar event of a lesson plan.
+
+    `enqueue` returns a job id at once; workers call manage_lesson_event
+    directly. Job status is kept in memory and mirrored to the
+    `calendar_jobs` collection so any worker can answer a poll:
+      { id, status: queued|running|done|failed, result?, error? }
+    A retry resumes from the job's `progress` (Drive file and event already
+    made), so a failed attempt does not leave a duplicate file or event.
+    """
+
+    def __init__(self, db: firestore.Client):
+        self._db = db
+        self._jobs = OrderedDict()  # job_id -> job dict
+        self._queue = None
+        self._workers = []
+
+    def _start(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._workers = [asyncio.create_task(self._work()) for _ in range(WORKERS)]
+
+    def enqueue(self, user_id: str, session_id: str, slots: dict, lesson_text: str) -> str:
+        self._start()
+        job = {
+            "id": str(uuid.uuid4()),
+            "uid": user_id,
+            "session_id": session_id,
+            "status": "queued",
+            "progress": {},
+            "args": {
+                "date": slots.get("date") or dt_date.today().isoformat(),
+                "title": slots.get("topic", ""),
+                "description": f"Lesson for grades {slots.get('grades', [])} on {slots.get('topic', '')}",
+                "attachment_content": lesson_text,
+            },
+        }
+        self._remember(job)
+        job["_queued_save"] = asyncio.create_task(self._save(job))
+        self._queue.put_nowait(job)
+        logger.debug("📅 calendar job %s queued for %s", job["id"], session_id)
+        return job["id"]
+
+    def _remember(self, job: dict) -> None:
+        self._jobs[job["id"]] = job
+        self._jobs.move_to_end(job["id"])
+        while len(self._jobs) > MAX_JOBS:
+            self._jobs.popitem(last=False)
+
+    async def _save(self, job: dict) -> None:
+        doc = {k: v for k, v in job.items() if k not in ("id", "args") and not k.startswith("_")}
+        doc["updated_at"] = firestore.SERVER_TIMESTAMP
+        try:
+            await run_blocking("firestore", self._db.collection("calendar_jobs").document(job["id"]).set, doc)
+        except Exception:
+            logger.exception("❌ could not save calendar job %s", job["id"])
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: dict) -> None:
+        # the "queued" write must not land after "running"
+        await job.pop("_queued_save")
+        job["status"] = "running"
+        await self._save(job)
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            t0 = time.monotonic()
+            try:
+                job["result"] = await run_blocking(
+                    "calendar", manage_lesson_event, **job["args"], progress=job["progress"]
+                )
+                job["status"] = "done"
+                logger.info("📅 calendar job %s %s in %.1fs", job["id"], job["result"].get("status"), time.monotonic() - t0)
+                break
+            except Exception as e:
+                logger.warning("calendar job %s attempt %d failed: %s", job["id"], attempt, e)
+                job["error"] = str(e)
+                if attempt == MAX_ATTEMPTS:
+                    job["status"] = "failed"
+                else:
+                    await asyncio.sleep(2 ** attempt)
+        if job["status"] == "done":
+            job.pop("error", None)
+        await self._save(job)
+
+    async def status(self, job_id: str):
+        """
+        The job as {id, status, result?, error?}, or None if unknown.
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            snap = await run_blocking("firestore", self._db.collection("calendar_jobs").document(job_id).get)
+            if not snap.exists:
+                return None
+            job = {"id": job_id, **snap.to_dict()}
+        return {k: job[k] for k in ("id", "uid", "status", "result", "error") if k in job}
+
+    async def drain(self, timeout: float = 30) -> None:
+        """
+        Gives queued jobs up to `timeout` seconds to finish; called on shutdown.
+        """
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("%d calendar jobs still queued at shutdown", self._queue.qsize())
+        for w in self._workers:
+            w.cancel()
@@ -1,31 +1,62 @@
 # app/agents/calendar_tool.py
 
 import os
-from google.oauth2 import service_account
+import threading
+
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaInMemoryUpload
 
+from app import clients
+
 # Scopes for Calendar + Drive
 SCOPES = [
     "https://www.googleapis.com/auth/calendar",
     "https://www.googleapis.com/auth/drive.file"
 ]
-creds = service_account.Credentials.from_service_account_file(
-    os.environ["GOOGLE_APPLICATION_CREDENTIALS"],
-    scopes=SCOPES
-)
+HTTP_TIMEOUT = int(os.getenv("GOOGLE_API_HTTP_TIMEOUT", "30"))
+
+# httplib2 connections are not thread-safe, so every worker thread builds its
+# Drive and Calendar services once and keeps them, along with the connection
+# to www.googleapis.com they share.
+_local = threading.local()
+
+
+def _build_services():
+    creds = clients.get("calendar_credentials")
+    http = AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+    drive = build("drive", "v3", http=http, static_discovery=True, cache_discovery=False)
+    cal = build("calendar", "v3", http=http, static_discovery=True, cache_discovery=False)
+    return drive, cal
+
+
+def services():
+    """
+    This thread's (drive, calendar) service objects.
+    """
+    svc = getattr(_local, "services", None)
+    if svc is None:
+        svc = _local.services = _build_services()
+    return svc
+
 
 def manage_lesson_event(
     date: str,
     title: str,
     description: str,
-    attachment_content: str
+    attachment_content: str,
+    progress: dict = None
 ) -> dict:
     """
     1) Upload `attachment_content` to Drive as a .txt
     2) Create/update a Calendar event on `date` with `title` & `description`
     3) Attach the Drive file to the event
 
+    Each step records what it did in `progress` ("drive_file", "shared",
+    "event"); called again with the same dict after a failure, it resumes
+    at the failed step instead of uploading and sharing another file.
+
     Returns a dict:
       {
         "status": "created"|"updated",
@@ -33,24 +64,31 @@ def manage_lesson_event(
         "attachment_url": "https://..."
       }
     """
+    if progress is None:
+        progress = {}
+    drive, cal = services()
+
     # — Upload to Drive —
-    drive = build("drive", "v3", credentials=creds)
     filename = f"{title}_{date}.txt"
-    media = MediaInMemoryUpload(
-        attachment_content.encode("utf-8"),
-        mimetype="text/plain"
-    )
-    drive_file = drive.files().create(
-        body={"name": filename},
-        media_body=media,
-        fields="id,webViewLink"
-    ).execute()
+    drive_file = progress.get("drive_file")
+    if drive_file is None:
+        media = MediaInMemoryUpload(
+            attachment_content.encode("utf-8"),
+            mimetype="text/plain"
+        )
+        drive_file = progress["drive_file"] = drive.files().create(
+            body={"name": filename},
+            media_body=media,
+            fields="id,webViewLink"
+        ).execute()
 
     # Make it shareable
-    drive.permissions().create(
-        fileId=drive_file["id"],
-        body={"role":"reader","type":"anyone"}
-    ).execute()
+    if not progress.get("shared"):
+        drive.permissions().create(
+            fileId=drive_file["id"],
+            body={"role":"reader","type":"anyone"}
+        ).execute()
+        progress["shared"] = True
 
     attachment = {
         "fileUrl":  drive_file["webViewLink"],
@@ -59,46 +97,47 @@ def manage_lesson_event(
     }
 
     # — Create or update the Calendar event —
-    cal = build("calendar", "v3", credentials=creds)
     cal_id = os.environ.get("CALENDAR_ID", "primary")
 
-    events = cal.events().list(
-        calendarId=cal_id,
-        timeMin=f"{date}T00:00:00Z",
-        timeMax=f"{date}T23:59:59Z",
-        q=title
-    ).execute().get("items", [])
-
-    body = {
-        "summary":     title,
-        "description": description,
-        "start":       {"date": date},
-        "end":         {"date": date},
-        "attachments": [attachment]
-    }
-
-    if events:
-        ev = events[0]
-        ev.update(body)
-        cal.events().update(
-            calendarId=cal_id,
-            eventId=ev["id"],
-            body=ev,
-            sendUpdates="all"
-        ).execute()
-        return {
-            "status": "updated",
-            "message": f"Updated event on {date} and attached your lesson plan.",
-            "attachment_url": drive_file["webViewLink"]
-        }
-    else:
-        cal.events().insert(
+    event = progress.get("event")
+    if event is None:
+        events = cal.events().list(
             calendarId=cal_id,
-            body=body,
-            sendUpdates="all"
-        ).execute()
-        return {
-            "status": "created",
-            "message": f"Created event on {date} and attached your lesson plan.",
-            "attachment_url": drive_file["webViewLink"]
+            timeMin=f"{date}T00:00:00Z",
+            timeMax=f"{date}T23:59:59Z",
+            q=title
+        ).execute().get("items", [])
+
+        body = {
+            "summary":     title,
+            "description": description,
+            "start":       {"date": date},
+            "end":         {"date": date},
+            "attachments": [attachment]
         }
+
+        if events:
+            ev = events[0]
+            ev.update(body)
+            cal.events().update(
+                calendarId=cal_id,
+                eventId=ev["id"],
+                body=ev,
+                sendUpdates="all"
+            ).execute()
+            event = {"id": ev["id"], "status": "updated"}
+        else:
+            ev = cal.events().insert(
+                calendarId=cal_id,
+                body=body,
+                sendUpdates="all"
+            ).execute()
+            event = {"id": ev.get("id"), "status": "created"}
+        progress["event"] = event
+
+    verb = "Updated" if event["status"] == "updated" else "Created"
+    return {
+        "status": event["status"],
+        "message": f"{verb} event on {date} and attached your lesson plan.",
+        "attachment_url": drive_file["webViewLink"]
+    }
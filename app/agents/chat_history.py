@@ -0,0 +1,263 @@
+# app/agents/chat_history.py
+
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+
+from google.api_core import exceptions as gexc
+from google.cloud import firestore
+
+from app import metrics
+from app.concurrency import run_blocking
+from app.agents import history_manager
+
+logger = logging.getLogger("app.agents.chat_history")
+
+HISTORY_LIMIT = int(os.getenv("CHAT_HISTORY_LIMIT", "10"))
+# A turn adds two messages, so the verbatim window stays two short of the
+# cache: messages are folded into the summary before they are evicted.
+WINDOW_MESSAGES = max(2, HISTORY_LIMIT - 2)
+MAX_SESSIONS = int(os.getenv("CHAT_HISTORY_CACHE_SESSIONS", "5000"))
+SESSION_TTL = int(os.getenv("CHAT_HISTORY_CACHE_TTL_SECONDS", "1800"))
+
+# How a cached session is trusted across workers:
+#   affinity → requests for a session always reach the same worker (sticky
+#              sessions), so the cache is authoritative; no reads per turn.
+#   version  → one read of the chat document per turn; the cache is used only
+#              if its `seq` still matches, and each commit is conditional on
+#              the document not having changed since.
+CONSISTENCY = os.getenv("CHAT_HISTORY_CONSISTENCY", "version")
+
+_stats = {
+    "hits": 0, "stale": 0, "loads": 0, "commits": 0, "conflicts": 0, "commit_errors": 0,
+    "summaries": 0, "summary_errors": 0,
+}
+
+
+class _Session:
+    def __init__(self, seq: int):
+        self.messages = deque(maxlen=HISTORY_LIMIT)  # {"sender", "text", "seq"}
+        self.seq = seq              # last seq handed out, including pending writes
+        self.committed_seq = seq    # last seq known to be in Firestore
+        self.update_time = None     # chat doc update_time read at the start of the turn
+        self.exists = seq > 0
+        self.pending = []           # messages of the current turn, not yet written
+        self.flush = None           # in-flight commit task
+        self.summary = ""           # rolling summary of messages up to summary_seq
+        self.summary_seq = None
+        self.summary_dirty = False  # summary not yet written to the chat doc
+        self.summarizing = None     # in-flight summary task
+        self.used = time.monotonic()
+
+
+@firestore.transactional
+def _renumber(transaction, chat, pending: list) -> None:
+    snap = chat.get(transaction=transaction)
+    seq = int((snap.to_dict() or {}).get("seq", 0))
+    msgs = chat.collection("messages")
+    for m in pending:
+        seq += 1
+        transaction.set(msgs.document(), {**m, "seq": seq, "ts": firestore.SERVER_TIMESTAMP})
+    transaction.set(chat, {"last_updated": firestore.SERVER_TIMESTAMP, "seq": seq}, merge=True)
+
+
+class ChatHistory:
+    """
+    Write-through cache of the last HISTORY_LIMIT messages of each chat
+    session.
+
+    `open_turn` adds the user's message and returns the history the agents
+    see; `close_turn` adds the reply and writes both messages plus the
+    session's `last_updated`/`seq` in one batch, in the background.
+    Every message carries a `seq`, numbered per session.
+    """
+
+    def __init__(self, db: firestore.Client, consistency: str = CONSISTENCY):
+        self._db = db
+        self._consistency = consistency
+        self._sessions = OrderedDict()  # session_id -> _Session
+        metrics.register("chat_history", self.snapshot)
+
+    def _chat(self, sid: str):
+        return self._db.collection("chat_sessions").document(sid)
+
+    def _load(self, sid: str) -> _Session:
+        snap = self._chat(sid).get()
+        data = snap.to_dict() or {}
+        docs = (
+            self._chat(sid).collection("messages")
+            .order_by("ts", direction=firestore.Query.DESCENDING)
+            .limit(HISTORY_LIMIT).stream()
+        )
+        s = _Session(int(data.get("seq", 0)))
+        s.exists = snap.exists
+        s.update_time = snap.update_time
+        s.summary = data.get("summary", "")
+        s.summary_seq = data.get("summary_seq")
+        # Both messages of a turn share one server timestamp; seq orders them.
+        rows = sorted((d.to_dict() for d in docs), key=lambda m: (m.get("ts"), m.get("seq") or 0))
+        for i, m in enumerate(rows):
+            # messages written before seq existed are numbered by position
+            seq = m.get("seq", s.seq - len(rows) + i + 1)
+            s.messages.append({"sender": m.get("sender"), "text": m.get("text"), "seq": seq})
+        _stats["loads"] += 1
+        return s
+
+    def _check(self, sid: str, s: _Session) -> bool:
+        """
+        True if the cached session still matches the chat document.
+        """
+        snap = self._chat(sid).get()
+        seq = int((snap.to_dict() or {}).get("seq", 0))
+        if snap.exists != s.exists or seq != s.committed_seq:
+            return False
+        s.update_time = snap.update_time
+        return True
+
+    async def open_turn(self, sid: str, prompt: str) -> list:
+        """
+        Records the user's message and returns the last HISTORY_LIMIT
+        messages of the session as [{sender, text}], oldest first.
+        """
+        self._evict()
+        s = self._sessions.get(sid)
+        if s is not None and s.flush is not None:
+            # a commit from the previous turn is still in flight
+            await asyncio.shield(s.flush)
+            s = self._sessions.get(sid)
+
+        if s is not None and self._consistency == "version":
+            if not await run_blocking("firestore", self._check, sid, s):
+                _stats["stale"] += 1
+                s = None
+        if s is None:
+            s = await run_blocking("firestore", self._load, sid)
+        else:
+            _stats["hits"] += 1
+
+        self._sessions[sid] = s
+        self._sessions.move_to_end(sid)
+        s.used = time.monotonic()
+        self._add(s, "user", prompt)
+        return [{"sender": m["sender"], "text": m["text"]} for m in s.messages]
+
+    def close_turn(self, sid: str, reply: str) -> None:
+        """
+        Records the bot's reply and schedules the batch commit of the turn.
+        """
+        s = self._sessions.get(sid)
+        if s is None:
+            return
+        self._add(s, "bot", reply)
+        pending, s.pending = s.pending, []
+        s.flush = asyncio.create_task(self._flush(sid, s, pending))
+
+        fold = history_manager.to_fold(list(s.messages), s.summary, s.summary_seq, WINDOW_MESSAGES)
+        if fold and s.summarizing is None:
+            s.summarizing = asyncio.create_task(self._summarize(sid, s, fold))
+
+    def summary(self, sid: str) -> str:
+        s = self._sessions.get(sid)
+        return s.summary if s is not None else ""
+
+    def seq(self, sid: str) -> int:
+        """
+        The seq of the session's latest message (0 if not loaded).
+        """
+        s = self._sessions.get(sid)
+        return s.seq if s is not None else 0
+
+    async def _summarize(self, sid: str, s: _Session, fold: list) -> None:
+        """
+        Folds messages leaving the verbatim window into the rolling summary.
+        It is saved on the chat doc with the next turn's commit.
+        """
+        try:
+            s.summary = await run_blocking("gemini", history_manager.summarize, s.summary, fold)
+            s.summary_seq = fold[-1]["seq"]
+            s.summary_dirty = True
+            _stats["summaries"] += 1
+            logger.debug("📝 summary of %s now covers up to seq %s", sid, s.summary_seq)
+        except Exception:
+            _stats["summary_errors"] += 1
+            logger.exception("❌ history summary failed for %s", sid)
+        finally:
+            s.summarizing = None
+
+    def _add(self, s: _Session, sender: str, text: str) -> None:
+        s.seq += 1
+        msg = {"sender": sender, "text": text, "seq": s.seq}
+        s.messages.append(msg)
+        s.pending.append(msg)
+
+    async def _flush(self, sid: str, s: _Session, pending: list) -> None:
+        try:
+            await run_blocking("firestore", self._commit, sid, s, pending)
+            s.committed_seq = pending[-1]["seq"]
+            s.exists = True
+            _stats["commits"] += 1
+        except (gexc.FailedPrecondition, gexc.AlreadyExists, gexc.Aborted):
+            # Another worker wrote to this session since we read it.
+            _stats["conflicts"] += 1
+            self._sessions.pop(sid, None)
+            try:
+                await run_blocking("firestore", self._commit_fresh, sid, pending)
+                _stats["commits"] += 1
+            except Exception:
+                _stats["commit_errors"] += 1
+                logger.exception("❌ chat history commit failed for %s after conflict", sid)
+        except Exception:
+            _stats["commit_errors"] += 1
+            self._sessions.pop(sid, None)
+            logger.exception("❌ chat history commit failed for %s", sid)
+        finally:
+            s.flush = None
+
+    def _commit(self, sid: str, s: _Session, pending: list) -> None:
+        chat = self._chat(sid)
+        msgs = chat.collection("messages")
+        batch = self._db.batch()
+        for m in pending:
+            batch.set(msgs.document(), {**m, "ts": firestore.SERVER_TIMESTAMP})
+        meta = {"last_updated": firestore.SERVER_TIMESTAMP, "seq": pending[-1]["seq"]}
+        if s.summary_dirty:
+            meta.update(summary=s.summary, summary_seq=s.summary_seq)
+            s.summary_dirty = False
+        if self._consistency != "version":
+            batch.set(chat, meta, merge=True)
+        elif s.exists:
+            batch.update(chat, meta, option=self._db.write_option(last_update_time=s.update_time))
+        else:
+            batch.create(chat, meta)
+        batch.commit()
+
+    def _commit_fresh(self, sid: str, pending: list) -> None:
+        """
+        Writes the turn after a conflict, numbering it after whatever the
+        other worker stored.
+        """
+        _renumber(self._db.transaction(), self._chat(sid), pending)
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        while self._sessions:
+            sid, s = next(iter(self._sessions.items()))
+            if len(self._sessions) < MAX_SESSIONS and now - s.used < SESSION_TTL:
+                break
+            if s.flush is not None:
+                self._sessions.move_to_end(sid)
+                break
+            del self._sessions[sid]
+
+    async def drain(self) -> None:
+        """
+        Waits for every in-flight commit; called on shutdown.
+        """
+        tasks = [t for s in self._sessions.values() for t in (s.flush, s.summarizing) if t is not None]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def snapshot(self) -> dict:
+        return {**_stats, "sessions": len(self._sessions), "consistency": self._consistency}
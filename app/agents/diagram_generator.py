@@ -1,28 +1,62 @@
 # app/agents/diagram_generator.py
 
+import io
 import os
 import logging
+from typing import List, Optional
 
-# Vertex AI (Imagen 4)
-import vertexai
-from vertexai.preview.vision_models import ImageGenerationModel
+try:
+    from PIL import Image
+except ImportError:  # thumbnails are optional
+    Image = None
+
+from app import clients
 
 logger = logging.getLogger("app.agents.diagram_generator")
 
-# ─── Vertex AI Initialization ───────────────────────────────────────────────
-vertexai.init(
-    project=os.environ["GOOGLE_CLOUD_PROJECT"],
-    location=os.environ["GOOGLE_CLOUD_LOCATION"],
-)
+MAX_IMAGES_PER_CALL = 4
+THUMBNAIL_PX = int(os.getenv("DIAGRAM_THUMBNAIL_PX", "256"))
+
 
-# Load the Imagen 4 model
-img_model = ImageGenerationModel.from_pretrained("imagen-4.0-generate-preview-06-06")
+def _enrich(prompt: str, diagram_type: str, grade: int, subject: Optional[str]) -> str:
+    teacher = f"Grade {grade} {subject} teacher" if subject else f"Grade {grade} teacher"
+    return f"As a {teacher}, draw a {diagram_type} diagram of: {prompt}"
+
+
+def run_diagram_variants(
+    prompt: str,
+    diagram_type: str,
+    grade: int,
+    subject: Optional[str] = None,
+    count: int = 1
+) -> List[bytes]:
+    """
+    Generates `count` diagram variants and returns their raw PNG bytes.
+    Imagen returns up to MAX_IMAGES_PER_CALL images per request, so up to
+    four variants cost one call. Imagen may return fewer images than asked
+    for if some are filtered.
+    """
+    enriched = _enrich(prompt, diagram_type, grade, subject)
+    logger.debug("Enriched prompt (%d variants): %s", count, enriched)
+
+    img_model = clients.get("imagen")  # Imagen 4
+    images = []
+    for start in range(0, count, MAX_IMAGES_PER_CALL):
+        response = img_model.generate_images(
+            prompt=enriched,
+            number_of_images=min(MAX_IMAGES_PER_CALL, count - start)
+        )
+        images.extend(img._image_bytes for img in response.images)
+    if not images:
+        raise RuntimeError("Imagen returned no images for this prompt")
+    return images
 
 
 def run_diagram_pipeline(
     prompt: str,
     diagram_type: str,
-    grade: int
+    grade: int,
+    subject: Optional[str] = None
 ) -> bytes:
     """
     Generates a single diagram image using Vertex AI Imagen 4 and returns raw PNG bytes.
@@ -31,19 +65,24 @@ def run_diagram_pipeline(
       prompt: The text to visualize.
       diagram_type: Type of diagram to draw.
       grade: Grade level (for prompt context).
+      subject: Optional subject (for prompt context).
 
     Returns:
       PNG image bytes.
     """
-    # Enrich the prompt for context
-    enriched = f"As a Grade {grade} teacher, draw a {diagram_type} diagram of: {prompt}"
-    logger.debug("Enriched prompt: %s", enriched)
-
-    # Generate exactly one image
-    response = img_model.generate_images(
-        prompt=enriched,
-        number_of_images=1
-    )
-    gen_image = response.images[0]
-    image_bytes = gen_image._image_bytes
-    return image_bytes
+    return run_diagram_variants(prompt, diagram_type, grade, subject, count=1)[0]
+
+
+def make_thumbnail(png: bytes, max_px: int = THUMBNAIL_PX) -> Optional[bytes]:
+    """
+    Downscales a PNG so its longer side is `max_px` and returns it as JPEG
+    bytes, or None if Pillow is not installed.
+    """
+    if Image is None:
+        return None
+    with Image.open(io.BytesIO(png)) as img:
+        img = img.convert("RGB")
+        img.thumbnail((max_px, max_px))
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=70, optimize=True)
+    return buf.getvalue()
@@ -0,0 +1,143 @@
+# app/agents/history_manager.py
+
+import os
+import logging
+from typing import List, Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest
+from google.genai import types as genai_types
+
+from app.llm import generate
+
+logger = logging.getLogger("app.agents.history_manager")
+
+# Tokens of conversation history (summary + verbatim turns) sent with each
+# model call, on top of the current turn.
+TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+SUMMARY_MAX_WORDS = int(os.getenv("HISTORY_SUMMARY_MAX_WORDS", "200"))
+
+
+def count_tokens(text: str) -> int:
+    """
+    Cheap token estimate (~4 characters per token); no tokenizer round trip.
+    """
+    return (len(text or "") + 3) // 4
+
+
+def _message_tokens(messages: list) -> int:
+    return sum(count_tokens(m.get("text")) + 2 for m in messages)
+
+
+def window(messages: list, summary: str, max_messages: int) -> list:
+    """
+    The newest messages that fit the budget left after `summary`, at most
+    `max_messages` of them and always at least the last one.
+    """
+    budget = TOKEN_BUDGET - count_tokens(summary)
+    keep, used = [], 0
+    for m in reversed(messages[-max_messages:]):
+        used += _message_tokens([m])
+        if keep and used > budget:
+            break
+        keep.append(m)
+    return keep[::-1]
+
+
+def to_fold(messages: list, summary: str, summary_seq: Optional[int], max_messages: int) -> list:
+    """
+    Messages outside the verbatim window that the summary does not cover yet.
+    """
+    recent = window(messages, summary, max_messages)
+    older = messages[:len(messages) - len(recent)]
+    return [m for m in older if summary_seq is None or m["seq"] > summary_seq]
+
+
+def summarize(summary: str, messages: list) -> str:
+    """
+    Folds `messages` into the running `summary` with a small model.
+    """
+    transcript = "\n".join(f"{m['sender']}: {m['text']}" for m in messages)
+    prompt = f"""
+You maintain a running summary of a conversation between a teacher and a
+teaching assistant. Update the summary with the new messages below. Keep the
+topics, grades, languages, dates and any decisions or materials the teacher
+may refer back to. At most {SUMMARY_MAX_WORDS} words. Output only the summary.
+
+Current summary:
+{summary or "(none)"}
+
+New messages:
+{transcript}
+"""
+    resp = generate("history_summary", prompt)
+    return resp.text.strip()
+
+
+# ─── ADK callback ────────────────────────────────────────────────────────────
+
+def _text(content: genai_types.Content) -> str:
+    return " ".join(p.text for p in content.parts or [] if p.text)
+
+
+def _starts_turn(content: genai_types.Content) -> bool:
+    # A turn starts at a teacher message. Other agents' output is also passed
+    # as role "user", prefixed with "For context:".
+    if content.role != "user" or not content.parts:
+        return False
+    first = content.parts[0]
+    return bool(first.text) and first.text != "For context:"
+
+
+def _split_turns(contents: List[genai_types.Content]) -> list:
+    turns = []
+    for c in contents:
+        if _starts_turn(c) or not turns:
+            turns.append([])
+        turns[-1].append(c)
+    return turns
+
+
+def _note(text: str) -> genai_types.Content:
+    return genai_types.Content(role="user", parts=[genai_types.Part(text=text)])
+
+
+def compact_history(callback_context: CallbackContext, llm_request: LlmRequest):
+    """
+    before_model_callback for the ask-sahayak agents.
+
+    Drops the oldest whole turns from the request until the earlier
+    conversation fits TOKEN_BUDGET, and puts the rolling summary of what was
+    dropped (state["history_summary"]) in front. A session that has just been
+    created carries no earlier turns, so the last messages from
+    state["history"] are passed instead.
+    """
+    state = callback_context.state
+    summary = state.get("history_summary") or ""
+    turns = _split_turns(llm_request.contents or [])
+    if not turns:
+        return None
+
+    current, earlier = turns[-1], turns[:-1]
+    budget = TOKEN_BUDGET - count_tokens(summary)
+    keep, used = [], 0
+    for turn in reversed(earlier):
+        used += sum(count_tokens(_text(c)) for c in turn)
+        if used > budget:
+            break
+        keep.insert(0, turn)
+
+    preamble = []
+    if summary:
+        preamble.append(_note(f"Summary of the earlier conversation:\n{summary}"))
+    if not earlier:
+        recent = window((state.get("history") or [])[:-1], summary, len(state.get("history") or []))
+        if recent:
+            lines = "\n".join(f"{m['sender']}: {m['text']}" for m in recent)
+            preamble.append(_note(f"Recent messages:\n{lines}"))
+
+    dropped = len(earlier) - len(keep)
+    if dropped:
+        logger.debug("✂️ %s: dropped %d earlier turns (~%d tokens kept)", callback_context.agent_name, dropped, used)
+    llm_request.contents = preamble + [c for turn in keep for c in turn] + current
+    return None
@@ -0,0 +1,377 @@
+# app/agents/intent_classifier.py
+
+import os
+import re
+import math
+import logging
+import datetime as dt
+from collections import Counter, defaultdict
+
+from app import metrics
+
+logger = logging.getLogger("app.agents.intent_classifier")
+
+INTENTS = ("chat", "explanation", "story", "quiz", "lesson_plan", "game", "reflect")
+
+# "on"     → use the local result when confident, otherwise fall back to intent_agent
+# "off"    → always call intent_agent
+# "shadow" → always call intent_agent, but also run the local classifier and record
+#            disagreements (under "intent_fastpath" in /metrics)
+# Shadow is the default until the disagreement rate has been measured.
+FASTPATH_MODE = os.getenv("INTENT_FASTPATH", "shadow").lower()
+MIN_CONFIDENCE = float(os.getenv("INTENT_FASTPATH_MIN_CONFIDENCE", "0.8"))
+
+# ─── Keyword / regex rules ───────────────────────────────────────────────────
+# Checked in this order when several intents match; the first one wins.
+_RULES = {
+    "lesson_plan": [
+        r"\blesson[\s-]*plans?\b", r"\bplan\s+(?:a|my|the|tomorrow'?s)?\s*(?:lesson|class|period)\b",
+        r"\bteaching\s+plan\b", r"\bpaath\s+yojana\b",
+    ],
+    "quiz": [
+        r"\bquiz(?:zes)?\b", r"\bmcqs?\b", r"\bmultiple[\s-]*choice\b",
+        r"\b(?:test|practice)\s+questions?\b", r"\bquestion\s+paper\b",
+    ],
+    "story": [
+        r"\bstor(?:y|ies)\b", r"\bkahaani?\b", r"\bkatha\b", r"\bnarrative\b", r"\bfable\b", r"\bfolk\s*tale\b",
+    ],
+    "game": [
+        r"\bgames?\b", r"\bkhel\b", r"\bclassroom\s+activit(?:y|ies)\b", r"\brole[\s-]*play\b",
+    ],
+    "reflect": [
+        r"\breflect(?:ion)?\b", r"\bhow\s+(?:can|do|should)\s+i\s+improve\b",
+        r"\bmy\s+(?:students|class|kids)\s+(?:did\s*n[o']?t|could\s*n[o']?t|were\s+not|are\s+not|struggled)\b",
+        r"\b(?:students|class)\s+(?:struggled|got\s+confused|lost\s+interest)\b",
+        r"\bmy\s+(?:lesson|class)\s+(?:went|did\s*n[o']?t\s+go)\b",
+    ],
+    "explanation": [
+        r"^\s*(?:please\s+)?(?:explain|define|describe|what\s+(?:is|are|was|were)|why\s+(?:is|are|do|does)|how\s+(?:does|do|is|are))\b",
+        r"\bexplain\b", r"\bsamjhao\b", r"\bsamjha(?:iye|o)\b", r"\bmeaning\s+of\b", r"\bdifference\s+between\b",
+    ],
+    "chat": [
+        r"^\s*(?:hi|hello|hey|namaste|namaskar|thanks|thank\s+you|ok(?:ay)?|good\s+(?:morning|evening|afternoon))\b[\s!.?]*$",
+    ],
+}
+_COMPILED = {k: [re.compile(p, re.I) for p in v] for k, v in _RULES.items()}
+
+# "... on it", "... about that": the subject is in the previous turn, which
+# only intent_agent sees.
+_BACKREF = re.compile(r"\b(?:on|about|of|for|with|from)\s+(?:it|that|this|them|those|these)\b[\s?.!]*$", re.I)
+
+# Follow-ups that only make sense against the previous turn.
+_FOLLOWUP = re.compile(
+    r"^\s*(?:and\s+)?(?:can\s+you\s+)?(?:make\s+it|simplify|shorter|longer|more|again|why\??$|"
+    r"what\s+about|translate\s+(?:it|that|this)|explain\s+(?:it|that|this)\s+again|(?:one|some)\s+more)\b",
+    re.I,
+)
+
+# ─── Tiny multinomial Naive Bayes over seed prompts ──────────────────────────
+_SEED = {
+    "chat": [
+        "hi", "hello sahayak", "thank you so much", "ok thanks that helps", "good morning",
+        "can you make it shorter", "translate that to hindi", "what did you mean by that",
+        "make it simpler", "one more please",
+    ],
+    "explanation": [
+        "explain photosynthesis", "what is the water cycle", "why is the sky blue",
+        "how does a plant make food", "define a noun for my class", "explain fractions with examples",
+        "tell me about the solar system", "describe the parts of a flower", "what are prime numbers",
+        "difference between weather and climate",
+    ],
+    "story": [
+        "write a story about honesty", "tell a story on friendship for kids", "a short story about a farmer",
+        "story about the moon in hindi", "narrate a tale about saving water", "kahani about a clever crow",
+        "moral story for grade 3", "create a story to teach counting",
+    ],
+    "quiz": [
+        "make a quiz on fractions", "create mcqs on the solar system", "5 questions to test addition",
+        "multiple choice questions about plants", "quiz my students on verbs", "test questions on the water cycle",
+        "prepare a question paper on animals",
+    ],
+    "lesson_plan": [
+        "lesson plan on photosynthesis for tomorrow", "plan a lesson about fractions",
+        "create a lesson plan for grade 4 maths", "schedule a lesson on the water cycle on monday",
+        "teaching plan for the solar system", "plan my class on shapes next week",
+    ],
+    "game": [
+        "suggest a game to teach multiplication", "classroom activity for learning colours",
+        "an interactive game about animals", "fun activity to practice spellings", "role play on shopkeeping",
+        "a game for the playground about numbers",
+    ],
+    "reflect": [
+        "my students did not understand fractions today", "the class got confused about verbs",
+        "how can i improve my science lessons", "students lost interest during the lesson",
+        "my lesson on plants did not go well", "reflection on today's maths class",
+        "kids struggled with long division",
+    ],
+}
+
+_TOKEN_RE = re.compile(r"[\w']+", re.UNICODE)
+
+
+def _features(text: str) -> list:
+    words = _TOKEN_RE.findall(text.lower())
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+
+def _train(seed: dict):
+    counts = {k: Counter() for k in seed}
+    for intent, examples in seed.items():
+        for ex in examples:
+            counts[intent].update(_features(ex))
+    vocab = set().union(*counts.values())
+    total = sum(len(v) for v in seed.values())
+    priors = {k: math.log(len(v) / total) for k, v in seed.items()}
+    denoms = {k: sum(c.values()) + len(vocab) for k, c in counts.items()}
+    return counts, vocab, priors, denoms
+
+
+_NB_COUNTS, _NB_VOCAB, _NB_PRIORS, _NB_DENOMS = _train(_SEED)
+
+
+def _nb_posteriors(text: str) -> dict:
+    feats = [f for f in _features(text) if f in _NB_VOCAB]
+    logp = {
+        k: _NB_PRIORS[k] + sum(math.log((_NB_COUNTS[k][f] + 1) / _NB_DENOMS[k]) for f in feats)
+        for k in _NB_PRIORS
+    }
+    top = max(logp.values())
+    exp = {k: math.exp(v - top) for k, v in logp.items()}
+    z = sum(exp.values())
+    return {k: v / z for k, v in exp.items()}
+
+
+# ─── Slot extraction ─────────────────────────────────────────────────────────
+_GRADE_LIST_RE = re.compile(
+    r"\b(?:grades?|class(?:es)?|std\.?|standards?)\s*"
+    r"(\d{1,2}(?:\s*(?:,|&|/|-|to|and)\s*\d{1,2})*)",
+    re.I,
+)
+_GRADE_ORD_RE = re.compile(
+    r"\b(\d{1,2})(?:st|nd|rd|th)\s*(?:(?:,|&|and)\s*(\d{1,2})(?:st|nd|rd|th)\s*)?(?:grade|class|standard|std)s?\b",
+    re.I,
+)
+
+_LANGUAGES = {
+    "english": "English", "hindi": "Hindi", "marathi": "Marathi", "kannada": "Kannada",
+    "tamil": "Tamil", "telugu": "Telugu", "bengali": "Bengali", "bangla": "Bengali",
+    "gujarati": "Gujarati", "malayalam": "Malayalam", "punjabi": "Punjabi", "odia": "Odia",
+    "oriya": "Odia", "urdu": "Urdu", "assamese": "Assamese",
+}
+_LANG_RE = re.compile(r"\b(?:in|into|using)\s+(" + "|".join(_LANGUAGES) + r")\b", re.I)
+_SCRIPTS = [
+    (re.compile(r"[\u0B80-\u0BFF]"), "Tamil"),
+    (re.compile(r"[\u0C80-\u0CFF]"), "Kannada"),
+    (re.compile(r"[\u0C00-\u0C7F]"), "Telugu"),
+    (re.compile(r"[\u0D00-\u0D7F]"), "Malayalam"),
+    (re.compile(r"[\u0A80-\u0AFF]"), "Gujarati"),
+    (re.compile(r"[\u0A00-\u0A7F]"), "Punjabi"),
+    (re.compile(r"[\u0B00-\u0B7F]"), "Odia"),
+    (re.compile(r"[\u0980-\u09FF]"), "Bengali"),
+    (re.compile(r"[\u0600-\u06FF]"), "Urdu"),
+    (re.compile(r"[\u0900-\u097F]"), "Hindi"),
+]
+
+_WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+_ISO_DATE_RE = re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")
+_REL_DATE_RE = re.compile(
+    r"\b(?:day\s+after\s+tomorrow|tomorrow|yesterday|today|in\s+(\d{1,2})\s+days?|"
+    r"(?:next|this|on)\s+(" + "|".join(_WEEKDAYS) + r")|next\s+week)\b",
+    re.I,
+)
+
+_LEAD_RE = re.compile(
+    r"^\s*(?:(?:can|could|would)\s+you\s+)?(?:please\s+)?"
+    r"(?:explain|describe|define|tell\s+(?:me\s+)?(?:a\s+)?(?:story\s+)?(?:about|on)?|"
+    r"write|create|make|prepare|generate|suggest|give\s+me|draft|plan|narrate|i\s+(?:need|want|would\s+like)|"
+    r"what\s+(?:is|are)|why\s+(?:is|are|do|does)|how\s+(?:does|do|is|are))\b\s*",
+    re.I,
+)
+# "thanks, now ...", "ok and also ..." ahead of the actual request
+_ACK_RE = re.compile(
+    r"^\s*(?:(?:ok(?:ay)?|thanks|thank\s+you|great|good|nice|cool|perfect|and|now|also|then)\b[\s,.!]*)+",
+    re.I,
+)
+_PRONOUN_RE = re.compile(r"^(?:it|that|this|them|those|these)$", re.I)
+_KINDS = (
+    r"(?:lesson[\s-]*plans?|lessons?|quiz(?:zes)?|mcqs?|multiple[\s-]*choice\s+questions?|questions?|"
+    r"stor(?:y|ies)|games?|activit(?:y|ies))"
+)
+_KIND_RE = re.compile(
+    r"^\s*(?:an?\s+|some\s+|\d+\s+)?(?:short\s+|fun\s+|interactive\s+|moral\s+)?"
+    + _KINDS + r"?\s*(?:about|on|for|of|to\s+teach|related\s+to)?\s+",
+    re.I,
+)
+# The same phrase later in the prompt ("... for my class, a quiz on verbs"), only
+# with an article and a preposition, so "the games of ancient Greece" stays whole.
+_KIND_ANY_RE = re.compile(
+    r"\b(?:an?\s+|some\s+|\d+\s+)(?:short\s+|fun\s+|interactive\s+|moral\s+)?"
+    + _KINDS + r"\s+(?:about|on|for|of|to\s+teach|related\s+to)\s+",
+    re.I,
+)
+
+
+def _extract_grades(text: str) -> list:
+    grades = []
+    for m in _GRADE_LIST_RE.finditer(text):
+        spec = m.group(1)
+        for a, b in re.findall(r"(\d{1,2})\s*(?:-|to)\s*(\d{1,2})", spec):
+            grades.extend(range(int(a), int(b) + 1))
+        spec = re.sub(r"\d{1,2}\s*(?:-|to)\s*\d{1,2}", " ", spec)
+        grades.extend(int(n) for n in re.findall(r"\d{1,2}", spec))
+    for m in _GRADE_ORD_RE.finditer(text):
+        grades.extend(int(g) for g in m.groups() if g)
+    return sorted({g for g in grades if 1 <= g <= 12})
+
+
+def _extract_language(text: str) -> str:
+    m = _LANG_RE.search(text)
+    if m:
+        return _LANGUAGES[m.group(1).lower()]
+    for pattern, language in _SCRIPTS:
+        if pattern.search(text):
+            return language
+    return "English"
+
+
+def _extract_date(text: str, today: dt.date) -> str:
+    m = _ISO_DATE_RE.search(text)
+    if m:
+        return m.group(1)
+    m = _REL_DATE_RE.search(text)
+    if not m:
+        return today.isoformat()
+    phrase = m.group(0).lower()
+    if phrase.startswith("day after"):
+        day = today + dt.timedelta(days=2)
+    elif phrase == "tomorrow":
+        day = today + dt.timedelta(days=1)
+    elif phrase == "yesterday":
+        day = today - dt.timedelta(days=1)
+    elif phrase == "next week":
+        day = today + dt.timedelta(days=7 - today.weekday())
+    elif m.group(1):
+        day = today + dt.timedelta(days=int(m.group(1)))
+    elif m.group(2):
+        ahead = (_WEEKDAYS.index(m.group(2).lower()) - today.weekday()) % 7
+        if ahead == 0 and phrase.startswith("next"):
+            ahead = 7
+        day = today + dt.timedelta(days=ahead)
+    else:
+        day = today
+    return day.isoformat()
+
+
+def _extract_topic(text: str) -> str:
+    topic = _GRADE_LIST_RE.sub(" ", text)
+    topic = _GRADE_ORD_RE.sub(" ", topic)
+    topic = _LANG_RE.sub(" ", topic)
+    topic = _ISO_DATE_RE.sub(" ", topic)
+    topic = _REL_DATE_RE.sub(" ", topic)
+    topic = _ACK_RE.sub("", topic)
+    topic = _LEAD_RE.sub("", topic)
+    topic = _KIND_RE.sub("", topic)
+    topic = _KIND_ANY_RE.sub("", topic, count=1)
+    topic = re.sub(r"\b(?:for|to|in|on|students?|kids|children|my|the)\s*$", "", topic.strip(" ?.!,"), flags=re.I)
+    topic = re.sub(r"\s+", " ", topic).strip(" ?.!,")
+    if _PRONOUN_RE.match(topic):
+        # "a quiz on it": the topic is in the previous turn
+        return ""
+    return topic or text.strip()
+
+
+def extract_slots(prompt: str, today: dt.date = None) -> dict:
+    """
+    Pulls grades, language, topic and date out of a teacher prompt using the
+    same slot names intent_agent produces.
+    """
+    today = today or dt.date.today()
+    return {
+        "grades": _extract_grades(prompt),
+        "language": _extract_language(prompt),
+        "topic": _extract_topic(prompt),
+        "date": _extract_date(prompt, today),
+    }
+
+
+# ─── Classifier ──────────────────────────────────────────────────────────────
+
+def classify_intent(prompt: str, history: list = None) -> dict:
+    """
+    Classifies a teacher prompt locally, without a model call.
+
+    Returns a dict:
+      {
+        "intent": one of INTENTS,
+        "slots": {grades, language, topic, date},
+        "confidence": float in [0, 1],
+      }
+    Callers should only trust results with confidence >= MIN_CONFIDENCE.
+    """
+    hits = [k for k, pats in _COMPILED.items() if any(p.search(prompt) for p in pats)]
+    post = _nb_posteriors(prompt)
+    nb_top = max(post, key=post.get)
+
+    if history and not hits and _FOLLOWUP.search(prompt):
+        intent, confidence = "chat", 0.9
+    elif len(hits) == 1:
+        # a keyword alone ("reflection of light", "games ... in Harappa") is not
+        # enough when Naive Bayes disagrees
+        intent = hits[0]
+        confidence = 0.95 if nb_top == intent else 0.7
+    elif hits:
+        # rules for different intents ("what is a lesson plan?") are ambiguous
+        # even when Naive Bayes sides with the first one
+        intent = hits[0]
+        confidence = 0.75 if nb_top == intent else 0.6
+    else:
+        intent, confidence = nb_top, post[nb_top] * 0.85
+
+    if history and _BACKREF.search(prompt):
+        # "thanks, now make a quiz on it": intent_agent resolves "it"
+        confidence = min(confidence, 0.6)
+
+    return {
+        "intent": intent,
+        "slots": extract_slots(prompt),
+        "confidence": round(confidence, 3),
+    }
+
+
+# ─── Shadow-mode bookkeeping ─────────────────────────────────────────────────
+shadow_stats = {"total": 0, "disagree": 0, "by_pair": defaultdict(int)}
+
+
+def record_shadow(local: dict, llm_intent: str) -> None:
+    """
+    Records whether the local classifier agreed with intent_agent and logs the
+    running disagreement rate.
+    """
+    shadow_stats["total"] += 1
+    if local["intent"] != llm_intent:
+        shadow_stats["disagree"] += 1
+        shadow_stats["by_pair"][f"{local['intent']}->{llm_intent}"] += 1
+        logger.info(
+            "🕵️ intent shadow disagreement: local=%s (%.2f) llm=%s",
+            local["intent"], local["confidence"], llm_intent,
+        )
+    logger.info(
+        "🕵️ intent shadow disagreement rate: %d/%d (%.1f%%)",
+        shadow_stats["disagree"], shadow_stats["total"],
+        100.0 * shadow_stats["disagree"] / shadow_stats["total"],
+    )
+
+
+def _metrics() -> dict:
+    total, disagree = shadow_stats["total"], shadow_stats["disagree"]
+    return {
+        "mode": FASTPATH_MODE,
+        "min_confidence": MIN_CONFIDENCE,
+        "shadow_total": total,
+        "shadow_disagree": disagree,
+        "shadow_disagree_rate": round(disagree / total, 4) if total else 0.0,
+        "shadow_by_pair": dict(shadow_stats["by_pair"]),
+    }
+
+
+metrics.register("intent_fastpath", _metrics)
@@ -2,9 +2,11 @@
 
 from google.adk.agents import LlmAgent
 
+from app.llm import adk_model
+
 intent_agent = LlmAgent(
     name="intent_agent",
-    model="gemini-2.5-pro",
+    model=adk_model("intent"),
     instruction="""
 You receive a single teacher prompt. Parse it into JSON with these keys:
 {
@@ -1,21 +1,12 @@
 import os
 import json
 import logging
-import vertexai
-from vertexai.preview.generative_models import GenerativeModel
+
+from app.llm import generate
 #inc
 
 logger = logging.getLogger("app.agents.mindmap_generator")
 
-# ─── Vertex AI Initialization ───────────────────────────────────────────────
-vertexai.init(
-    project=os.environ["GOOGLE_CLOUD_PROJECT"],
-    location=os.environ["GOOGLE_CLOUD_LOCATION"],
-)
-
-# Load Gemini model
-gemini = GenerativeModel("gemini-2.5-pro")
-
 def fix_plantuml_code(uml_code: str) -> str:
     """
     Cleans and formats PlantUML mind map code generated by Gemini.
@@ -72,7 +63,7 @@ def run_mindmap_pipeline(
     logger.debug("🧠 Mindmap prompt: %s", prompt)
 
     # Step 1: Ask Gemini
-    response = gemini.generate_content(prompt)
+    response = generate("mindmap", prompt)
     raw_code = response.text.strip()
     logger.debug("🪵 Raw Gemini response:\n%r", raw_code)
 
@@ -0,0 +1,199 @@
+# app/agents/ocr.py
+
+import os
+import io
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import List
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import UploadFile
+from google.cloud import vision
+
+from app import clients, metrics
+from app.cache import TieredCache
+from app.concurrency import run_blocking
+
+try:
+    from PIL import Image
+except ImportError:  # perceptual matching is optional
+    Image = None
+
+logger = logging.getLogger("app.agents.ocr")
+
+# Concurrent Vision requests per OCR call, and images per batch_annotate_images
+# request (the API accepts at most 16).
+OCR_FANOUT = int(os.getenv("OCR_FANOUT", "4"))
+OCR_BATCH_SIZE = max(1, min(16, int(os.getenv("OCR_BATCH_SIZE", "4"))))
+UPLOAD_CHUNK = 1024 * 1024
+
+_TEXT_DETECTION = [vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)]
+
+# ─── Result cache ────────────────────────────────────────────────────────────
+# Keyed on sha256 of the image bytes; OCR_CACHE_DISK=1 adds a local disk tier
+# shared by the workers on a host. OCR_CACHE_PERCEPTUAL=1 also matches
+# re-encoded/resized copies of a page by a 256-bit difference hash, for calls
+# that ask for it: textbook pages, never answer sheets, where two students'
+# copies of one printed template hash alike.
+_cache = TieredCache(
+    "ocr",
+    memory_size=int(os.getenv("OCR_CACHE_MEMORY_ENTRIES", "2000")),
+    ttl=int(os.getenv("OCR_CACHE_TTL_SECONDS", str(30 * 86400))),
+    disk=os.getenv("OCR_CACHE_DISK", "0") == "1",
+    disk_size=int(os.getenv("OCR_CACHE_DISK_ENTRIES", "50000")),
+)
+PERCEPTUAL = os.getenv("OCR_CACHE_PERCEPTUAL", "0") == "1" and Image is not None
+PHASH_DISTANCE = int(os.getenv("OCR_CACHE_PHASH_DISTANCE", "6"))
+_PHASH_MAX = 5000
+_phash_index = OrderedDict()  # dhash -> sha256 key, newest last
+_phash_lock = threading.Lock()
+_phash_stats = {"perceptual_hits": 0}
+
+
+def _dhash(b: bytes):
+    try:
+        with Image.open(io.BytesIO(b)) as img:
+            px = list(img.convert("L").resize((17, 16)).getdata())
+    except Exception:
+        return None
+    bits = 0
+    for row in range(16):
+        for col in range(16):
+            bits = (bits << 1) | (px[row * 17 + col] > px[row * 17 + col + 1])
+    return bits
+
+
+def _perceptual_lookup(h: int, saved: int):
+    with _phash_lock:
+        match = next(
+            (key for other, key in reversed(_phash_index.items()) if (h ^ other).bit_count() <= PHASH_DISTANCE),
+            None,
+        )
+    if match is None:
+        return None
+    text = _cache.peek(match)
+    if text is not None:
+        _cache.note_saved(saved)
+        with _phash_lock:
+            _phash_stats["perceptual_hits"] += 1
+    return text
+
+
+def _remember_phash(h: int, key: str) -> None:
+    with _phash_lock:
+        _phash_index[h] = key
+        _phash_index.move_to_end(h)
+        while len(_phash_index) > _PHASH_MAX:
+            _phash_index.popitem(last=False)
+
+
+def _response_text(resp) -> str:
+    if resp.error.message:
+        raise RuntimeError(f"Vision API error: {resp.error.message}")
+    return (resp.full_text_annotation.text or "").strip()
+
+
+def _detect(images: List[bytes]) -> List[str]:
+    if len(images) == 1:
+        res = clients.get("vision").text_detection(image=vision.Image(content=images[0]))
+        return [_response_text(res)]
+    resp = clients.get("vision").batch_annotate_images(requests=[
+        vision.AnnotateImageRequest(image=vision.Image(content=b), features=_TEXT_DETECTION)
+        for b in images
+    ])
+    return [_response_text(r) for r in resp.responses]
+
+
+def ocr_batch(images: List[bytes], perceptual: bool = False) -> List[str]:
+    """
+    OCR up to 16 images in one Vision round trip, in order. Pages already
+    in the result cache are not sent to Vision. With `perceptual`, a page
+    also matches near-identical cached ones (see OCR_CACHE_PERCEPTUAL).
+    """
+    texts = [None] * len(images)
+    keys, hashes, todo = [], [], []
+    for i, b in enumerate(images):
+        key = hashlib.sha256(b).hexdigest()
+        h = _dhash(b) if perceptual and PERCEPTUAL else None
+        keys.append(key)
+        hashes.append(h)
+        texts[i] = _cache.get(key, len(b))
+        if texts[i] is None and h is not None:
+            texts[i] = _perceptual_lookup(h, len(b))
+        if texts[i] is None:
+            todo.append(i)
+
+    if todo:
+        for i, text in zip(todo, _detect([images[i] for i in todo])):
+            texts[i] = text
+            _cache.set(keys[i], text)
+            if hashes[i] is not None:
+                _remember_phash(hashes[i], keys[i])
+    logger.debug("📄 OCR batch of %d: %d from cache", len(images), len(images) - len(todo))
+    return texts
+
+
+def ocr_image_to_text(b: bytes) -> str:
+    """
+    OCR a single image and return its text.
+    """
+    return ocr_batch([b])[0]
+
+
+def _chunks(items: list, size: int) -> list:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def ocr_images_to_text(image_bytes_list: List[bytes], perceptual: bool = False) -> List[str]:
+    """
+    Perform OCR on each image and return a list of text pages, in order.
+    Batches run concurrently, up to OCR_FANOUT at a time.
+    """
+    batches = _chunks(list(image_bytes_list), OCR_BATCH_SIZE)
+    if len(batches) <= 1:
+        return ocr_batch(batches[0], perceptual) if batches else []
+    with ThreadPoolExecutor(max_workers=min(OCR_FANOUT, len(batches))) as ex:
+        results = list(ex.map(lambda b: ocr_batch(b, perceptual), batches))
+    return [text for batch in results for text in batch]
+
+
+async def _read_upload(f: UploadFile) -> bytes:
+    buf = bytearray()
+    while chunk := await f.read(UPLOAD_CHUNK):
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+async def ocr_uploads(files: List[UploadFile], perceptual: bool = False) -> List[str]:
+    """
+    OCR uploaded images concurrently, preserving upload order.
+
+    A file is only read when its batch gets one of the OCR_FANOUT slots, so
+    at most OCR_FANOUT * OCR_BATCH_SIZE images are held in memory at once.
+    """
+    slots = asyncio.Semaphore(OCR_FANOUT)
+
+    async def run(batch: List[UploadFile]) -> List[str]:
+        async with slots:
+            images = [await _read_upload(f) for f in batch]
+            return await run_blocking("vision", ocr_batch, images, perceptual)
+
+    results = await asyncio.gather(*(run(b) for b in _chunks(list(files), OCR_BATCH_SIZE)))
+    logger.debug("📄 OCR'd %d uploads in %d batches", len(files), len(results))
+    return [text for batch in results for text in batch]
+
+
+def _metrics() -> dict:
+    snap = _cache.snapshot()
+    with _phash_lock:
+        snap.update(_phash_stats, perceptual=PERCEPTUAL, perceptual_index=len(_phash_index))
+    lookups = snap["memory_hits"] + snap["disk_hits"] + snap["misses"]
+    # a perceptual hit is an exact-key miss answered by the dhash index
+    snap["perceptual_hit_rate"] = round(snap["perceptual_hits"] / lookups, 4) if lookups else 0.0
+    return snap
+
+
+metrics.register("ocr_cache", _metrics)
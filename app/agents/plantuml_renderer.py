@@ -0,0 +1,154 @@
+# app/agents/plantuml_renderer.py
+
+import os
+import time
+import queue
+import uuid
+import select
+import hashlib
+import logging
+import threading
+import subprocess
+
+from app.cache import TieredCache
+
+logger = logging.getLogger("app.agents.plantuml_renderer")
+
+PLANTUML_JAR = os.getenv("PLANTUML_JAR", "/opt/plantuml/plantuml.jar")
+PLANTUML_JAVA = os.getenv("PLANTUML_JAVA", "java")
+POOL_SIZE = int(os.getenv("PLANTUML_POOL_SIZE", "2"))
+RENDER_TIMEOUT = float(os.getenv("PLANTUML_RENDER_TIMEOUT", "30"))
+
+FORMATS = {"svg": "image/svg+xml", "png": "image/png"}
+
+# Rendered output keyed on a hash of (format, cleaned code).
+_cache = TieredCache(
+    "mindmap_render",
+    memory_size=int(os.getenv("MINDMAP_RENDER_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    ttl=int(os.getenv("MINDMAP_RENDER_CACHE_TTL_SECONDS", str(7 * 86400))),
+    disk=os.getenv("MINDMAP_RENDER_CACHE_DISK", "0") == "1",
+    getsizeof=len,
+)
+
+
+class _PipeRenderer:
+    """
+    One long-lived `plantuml -pipe` JVM for a single output format. Diagrams
+    are written to stdin; each rendered image is followed on stdout by a
+    per-process delimiter. The JVM is restarted if it dies or hangs.
+    """
+
+    def __init__(self, fmt: str):
+        self.fmt = fmt
+        self._delim = f"__sahayak_{uuid.uuid4().hex}__".encode("ascii")
+        self._proc = None
+        self._start()
+
+    def _start(self) -> None:
+        self._proc = subprocess.Popen(
+            [
+                PLANTUML_JAVA, "-Djava.awt.headless=true", "-jar", PLANTUML_JAR,
+                "-pipe", f"-t{self.fmt}", "-charset", "UTF-8",
+                "-pipedelimitor", self._delim.decode("ascii"),
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        logger.info("☕ PlantUML %s renderer started (pid %s)", self.fmt, self._proc.pid)
+
+    def close(self) -> None:
+        if self._proc and self._proc.poll() is None:
+            self._proc.kill()
+            self._proc.wait()
+
+    def render(self, code: str) -> bytes:
+        if self._proc.poll() is not None:
+            logger.warning("PlantUML %s renderer exited with %s; restarting", self.fmt, self._proc.returncode)
+            self._start()
+        try:
+            self._proc.stdin.write(code.encode("utf-8") + b"\n")
+            self._proc.stdin.flush()
+            return self._read_until_delimiter()
+        except Exception:
+            self.close()
+            self._start()
+            raise
+
+    def _read_until_delimiter(self) -> bytes:
+        fd = self._proc.stdout.fileno()
+        deadline = time.monotonic() + RENDER_TIMEOUT
+        buf = bytearray()
+        while True:
+            idx = buf.find(self._delim)
+            if idx >= 0:
+                # The image ends right before the delimiter. The newline printed
+                # after the previous delimiter arrives at the front; images never
+                # start with one (PNG: 0x89, SVG: '<').
+                return bytes(buf[:idx]).lstrip(b"\r\n")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"PlantUML did not render within {RENDER_TIMEOUT}s")
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if ready:
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    raise RuntimeError("PlantUML renderer exited while rendering")
+                buf.extend(chunk)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool(fmt: str) -> queue.Queue:
+    pool = _pools.get(fmt)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(fmt)
+            if pool is None:
+                if not os.path.exists(PLANTUML_JAR):
+                    raise RuntimeError(f"PlantUML renderer not available: {PLANTUML_JAR} not found")
+                pool = queue.Queue()
+                for _ in range(POOL_SIZE):
+                    pool.put(_PipeRenderer(fmt))
+                _pools[fmt] = pool
+    return pool
+
+
+def render_key(code: str, fmt: str) -> str:
+    return hashlib.sha256(f"{fmt}\n{code}".encode("utf-8")).hexdigest()
+
+
+def render_plantuml(code: str, fmt: str = "svg") -> bytes:
+    """
+    Renders PlantUML `code` to SVG or PNG bytes using the renderer pool.
+    Results are cached by a hash of the format and code. Raises TimeoutError
+    when no renderer frees up within RENDER_TIMEOUT.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format: {fmt}")
+    key = render_key(code, fmt)
+    out = _cache.get(key)
+    if out is not None:
+        return out
+
+    pool = _pool(fmt)
+    try:
+        renderer = pool.get(timeout=RENDER_TIMEOUT)
+    except queue.Empty:
+        raise TimeoutError(f"all {POOL_SIZE} PlantUML renderers busy for {RENDER_TIMEOUT:g}s") from None
+    try:
+        out = renderer.render(code)
+    finally:
+        pool.put(renderer)
+    _cache.set(key, out)
+    return out
+
+
+def shutdown_renderers() -> None:
+    with _pools_lock:
+        for pool in _pools.values():
+            while not pool.empty():
+                pool.get_nowait().close()
+        _pools.clear()
@@ -0,0 +1,108 @@
+# app/agents/pregrader.py
+
+import os
+import re
+import unicodedata
+from fractions import Fraction
+from typing import Dict, Optional
+
+# A one-word answer this long or longer that is one character off the key
+# (a typo or OCR slip) counts as a match; any other difference, such as a
+# different word form ("evaporating"), goes to the model. Numbers must be
+# equal in value (1/2 == 0.5), with no tolerance.
+FUZZY_MIN_LENGTH = int(os.getenv("AUTOEVAL_FUZZY_MIN_LENGTH", "5"))
+
+# "3)", "Q3:", "3." or "3 -", but not the "3." of a decimal like "3.5"
+_NUMBERED = re.compile(r"^\s*(?:q(?:uestion)?\.?\s*)?(\d{1,3})\s*(?:[\):]|[.\-](?!\d))\s*(.*)$", re.IGNORECASE)
+_MCQ_KEY = re.compile(r"^\(?([a-e])\)?(?:[\.\):]\s*.*)?$", re.IGNORECASE)
+_MCQ_GOT = re.compile(r"^\(?([a-e])\)?(?:[\.\):\s]|$)", re.IGNORECASE)
+_NUMBER = re.compile(r"^[-+]?(?:\d+(?:\.\d*)?|\.\d+)(?:\s*/\s*\d+)?$")
+
+
+def normalize(text: str) -> str:
+    """
+    Case-folded, NFKC-normalized text with whitespace collapsed and trailing
+    punctuation removed.
+    """
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.strip(" .,;:!?\"'`")
+
+
+def segment(text: str, num_questions: int) -> Optional[Dict[int, str]]:
+    """
+    Splits an OCR'd answer sheet into {question number: answer}. Numbered
+    lines ("3) ...", "Q3. ...") are used when present; otherwise one
+    non-empty line per question. Returns None when neither fits.
+
+    A line with an "=" is working ("2 - 1 = 1"), never a question number.
+    Lines following a numbered one are appended to its answer after a
+    newline.
+    """
+    lines = [l for l in (text or "").splitlines() if l.strip()]
+    answers, current = {}, None
+    for line in lines:
+        m = _NUMBERED.match(line)
+        if m and "=" not in m.group(2) and 1 <= int(m.group(1)) <= num_questions and int(m.group(1)) not in answers:
+            current = int(m.group(1))
+            answers[current] = m.group(2).strip()
+        elif current is not None:
+            answers[current] = f"{answers[current]}\n{line.strip()}".strip()
+    if answers:
+        return answers
+    if len(lines) == num_questions:
+        return {i + 1: l.strip() for i, l in enumerate(lines)}
+    return None
+
+
+def _number(text: str) -> Optional[Fraction]:
+    t = text.replace(",", "").replace(" ", "")
+    if not _NUMBER.match(t):
+        return None
+    try:
+        return Fraction(t)
+    except ZeroDivisionError:
+        return None
+
+
+def _one_edit(a: str, b: str) -> bool:
+    """
+    Whether `a` and `b` differ by exactly one substituted, inserted or
+    deleted character.
+    """
+    if abs(len(a) - len(b)) > 1 or a == b:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i + (len(a) == len(b)):] == b[i + 1:]
+
+
+def match(expected: str, got: str) -> Optional[bool]:
+    """
+    True/False when the answer can be judged locally, None when it needs
+    the model (free text, or a format we do not recognize).
+    """
+    exp, ans = normalize(expected), normalize(got)
+    if not ans:
+        return None
+    if exp == ans:
+        return True
+
+    key = _MCQ_KEY.match(exp)
+    if key and len(exp) <= 3:
+        picked = _MCQ_GOT.match(ans)
+        return picked.group(1) == key.group(1) if picked else None
+
+    want = _number(exp)
+    if want is not None:
+        have = _number(ans)
+        if have is None:
+            return None
+        return have == want
+
+    if " " not in exp and " " not in ans and len(exp) >= FUZZY_MIN_LENGTH and _one_edit(exp, ans):
+        return True
+    return None
@@ -0,0 +1,141 @@
+# app/agents/response_cache.py
+
+import os
+import re
+import zlib
+import hashlib
+import logging
+import threading
+
+import numpy as np
+
+from app import metrics
+from app.cache import make_store
+
+logger = logging.getLogger("app.agents.response_cache")
+
+# "memory" (per worker, default), "disk" (shared by workers on one host) or "off"
+BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory").lower()
+TTL = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400"))
+MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.92"))
+# chat/reflect depend on history. lesson_plan is cached: its calendar event
+# is a separate job, queued on a cache hit too.
+SKIP_INTENTS = {
+    i.strip() for i in os.getenv("RESPONSE_CACHE_SKIP_INTENTS", "chat,reflect").split(",")
+    if i.strip()
+}
+# Most recent entries of the bucket compared on a near-duplicate lookup, so a
+# miss costs a bounded scan (and bounded unpickling with the disk backend).
+NEAR_SCAN_LIMIT = int(os.getenv("RESPONSE_CACHE_NEAR_SCAN_LIMIT", "200"))
+
+_DIM = 1024
+_store = make_store("responses", BACKEND, MAX_ENTRIES, TTL) if BACKEND != "off" else None
+
+stats = {"hits_exact": 0, "hits_near": 0, "misses": 0, "skipped": 0, "stores": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        stats[name] += 1
+
+
+# ─── Normalisation & embedding ───────────────────────────────────────────────
+_FILLER_RE = re.compile(
+    r"\b(?:please|kindly|can you|could you|would you|i want|i need|help me|for my (?:class|students|kids))\b"
+)
+_PUNCT_RE = re.compile(r"[^\w\s]+", re.UNICODE)
+_NUM_RE = re.compile(r"\d+")
+
+
+def normalize(text: str) -> str:
+    text = _PUNCT_RE.sub(" ", (text or "").lower())
+    text = _FILLER_RE.sub(" ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def embed(text: str) -> np.ndarray:
+    """
+    Local hashed bag of words + character trigrams, L2-normalised. Cheap and
+    deterministic across workers (crc32, not Python's salted hash()).
+    """
+    vec = np.zeros(_DIM, dtype=np.float32)
+    for word in text.split():
+        feats = [word] + [f"#{word[i:i + 3]}" for i in range(max(1, len(word) - 2))]
+        for f in feats:
+            h = zlib.crc32(f.encode("utf-8"))
+            vec[h % _DIM] += 1.0 if (h >> 31) & 1 else -1.0
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+def _bucket(intent: str, slots: dict) -> str:
+    grades = ",".join(str(g) for g in sorted({int(g) for g in slots.get("grades") or [] if str(g).isdigit()}))
+    language = (slots.get("language") or "english").strip().lower()
+    return f"{intent}|{grades}|{language}|"
+
+
+def _exact_key(intent: str, slots: dict, prompt: str) -> str:
+    topic = normalize(slots.get("topic") or prompt)
+    return _bucket(intent, slots) + hashlib.sha1(topic.encode("utf-8")).hexdigest()
+
+
+# ─── Public API ──────────────────────────────────────────────────────────────
+
+def lookup(intent: str, slots: dict, prompt: str):
+    """
+    Returns (reply, kind) where kind is "exact", "near", "miss" or "skip".
+    reply is None unless kind is "exact" or "near".
+    """
+    if _store is None or intent in SKIP_INTENTS:
+        _count("skipped")
+        return None, "skip"
+
+    entry = _store.get(_exact_key(intent, slots, prompt))
+    if entry is not None:
+        _count("hits_exact")
+        return entry["reply"], "exact"
+
+    norm = normalize(prompt)
+    candidates = [v for _, v in _store.scan(_bucket(intent, slots), limit=NEAR_SCAN_LIMIT)]
+    if candidates:
+        numbers = _NUM_RE.findall(norm)
+        vec = embed(norm)
+        sims = np.stack([c["vector"] for c in candidates]) @ vec
+        for idx in np.argsort(-sims):
+            if sims[idx] < SIMILARITY:
+                break
+            # "12 times 13" and "12 times 14" embed almost identically
+            if _NUM_RE.findall(candidates[idx]["prompt"]) == numbers:
+                _count("hits_near")
+                logger.debug("🎯 near-duplicate (%.3f): %r ~ %r", sims[idx], norm, candidates[idx]["prompt"])
+                return candidates[idx]["reply"], "near"
+
+    _count("misses")
+    return None, "miss"
+
+
+def store(intent: str, slots: dict, prompt: str, reply: str) -> None:
+    if _store is None or intent in SKIP_INTENTS or not reply:
+        return
+    norm = normalize(prompt)
+    _store.set(_exact_key(intent, slots, prompt), {
+        "reply": reply,
+        "prompt": norm,
+        "vector": embed(norm),
+    })
+    _count("stores")
+
+
+def _metrics() -> dict:
+    with _stats_lock:
+        snap = dict(stats)
+    lookups = snap["hits_exact"] + snap["hits_near"] + snap["misses"]
+    snap["hit_rate"] = round((snap["hits_exact"] + snap["hits_near"]) / lookups, 4) if lookups else 0.0
+    snap["entries"] = len(_store) if _store is not None else 0
+    snap["backend"] = BACKEND
+    return snap
+
+
+metrics.register("response_cache", _metrics)
@@ -0,0 +1,132 @@
+# app/agents/runner_pool.py
+
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.adk.events import Event, EventActions
+
+logger = logging.getLogger("app.agents.runner_pool")
+
+APP_NAME = "ask-sahayak"
+SESSION_TTL = int(os.getenv("ADK_SESSION_TTL_SECONDS", "1800"))
+MAX_SESSIONS = int(os.getenv("ADK_MAX_SESSIONS", "1000"))
+# Turns a live session carries before it is rebuilt from the chat history, so
+# its events (and our handle) stay bounded; compact_history trims the prompt
+# either way.
+MAX_TURNS = int(os.getenv("ADK_SESSION_MAX_TURNS", "20"))
+
+# One session service for the whole process; every pooled runner shares it.
+session_service = InMemorySessionService()
+
+
+class RunnerPool:
+    """
+    Builds one Runner per agent up front and hands the same instance out on
+    every request.
+    """
+
+    def __init__(self, agents: dict):
+        self._runners = {
+            name: Runner(agent=agent, app_name=APP_NAME, session_service=session_service)
+            for name, agent in agents.items()
+        }
+        logger.info("🏊 Runner pool ready: %s", ", ".join(self._runners))
+
+    def get(self, name: str) -> Runner:
+        return self._runners[name]
+
+
+class SessionStore:
+    """
+    Keeps the ADK session of each chat `session_id` alive across turns.
+
+    Sessions idle for longer than `ttl` seconds, or beyond the newest
+    `max_sessions`, are dropped from the session service. A live session is
+    rebuilt from the chat history when turns happened without it (served by
+    another worker, or from the response cache) and after MAX_TURNS turns.
+    """
+
+    def __init__(self, service, max_sessions: int = MAX_SESSIONS, ttl: int = SESSION_TTL):
+        self._service = service
+        self._max = max_sessions
+        self._ttl = ttl
+        self._live = OrderedDict()  # (user_id, session_id) -> (session, last used, seq, turns)
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, user_id: str, session_id: str, history: list, slots: dict, seq: int = 0):
+        """
+        Returns the live ADK session for (user_id, session_id).
+
+        `seq` is the chat history seq of this turn's prompt. A new session is
+        seeded with `history` and `slots`. A live one already carries the
+        conversation in its events, so only `slots` is applied, as a state
+        delta, if its last turn is the previous one in the chat history
+        (seq two back: that prompt and its reply).
+        """
+        key = (user_id, session_id)
+        now = time.monotonic()
+        async with self._lock:
+            await self._evict(now)
+            live = self._live.get(key)
+            if live is not None and live[2] + 2 == seq and live[3] < MAX_TURNS:
+                session, _, _, turns = live
+                # Our handle is a copy; append_event also updates the stored session.
+                await self._service.append_event(session, Event(
+                    invocation_id=Event.new_id(),
+                    author="user",
+                    actions=EventActions(state_delta=slots),
+                ))
+                turns += 1
+                logger.debug("♻️ ADK session reused for %s", session_id)
+            else:
+                if live is not None:
+                    await self._service.delete_session(
+                        app_name=APP_NAME, user_id=user_id, session_id=session_id
+                    )
+                    logger.debug("🔄 ADK session of %s rebuilt from the chat history", session_id)
+                session = await self._service.create_session(
+                    app_name=APP_NAME, user_id=user_id,
+                    state={"history": history, **slots}, session_id=session_id,
+                )
+                turns = 1
+                logger.debug("🆕 ADK session created for %s", session_id)
+            self._live[key] = (session, now, seq, turns)
+            self._live.move_to_end(key)
+        return session
+
+    async def _evict(self, now: float) -> None:
+        while self._live:
+            key, (_, last_used, _, _) = next(iter(self._live.items()))
+            if len(self._live) < self._max and now - last_used < self._ttl:
+                break
+            del self._live[key]
+            await self._service.delete_session(
+                app_name=APP_NAME, user_id=key[0], session_id=key[1]
+            )
+            logger.debug("🧹 ADK session evicted for %s", key[1])
+
+
+@asynccontextmanager
+async def scratch_session(user_id: str, state: dict):
+    """
+    A throwaway session on the shared service, deleted when the block exits.
+    Used for one-shot agents such as intent_agent.
+    """
+    session = await session_service.create_session(
+        app_name=APP_NAME, user_id=user_id, state=state
+    )
+    try:
+        yield session
+    finally:
+        await session_service.delete_session(
+            app_name=APP_NAME, user_id=user_id, session_id=session.id
+        )
+
+
+session_store = SessionStore(session_service)
@@ -3,181 +3,241 @@
 import os
 import json
 import logging
-import re
 import io
+import time
+from datetime import timedelta
 from zipfile import ZipFile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import vertexai
-from vertexai.preview.generative_models import GenerativeModel
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
+from app import clients
+from app.llm import FALLBACK_SHARE, deadline_for, generate, generate_stream, json_config, models_for
+from .worksheet_pdf import generate_question_pdfs, generate_answer_pdfs
 
 
 logger = logging.getLogger(__name__)
 
-# ─── Vertex AI Initialization ───────────────────────────────────────────────
-vertexai.init(
-    project=os.environ["GOOGLE_CLOUD_PROJECT"],
-    location=os.environ["GOOGLE_CLOUD_LOCATION"],
-)
-gemini = GenerativeModel("gemini-2.5-pro")
 
+LEVELS = ["remedial", "core", "enrichment"]
 
-def _clean_response(raw: str) -> str:
-    """
-    Strip Markdown fences or stray wrappers so we get pure JSON.
-    """
-    # Remove triple-backtick fences
-    if raw.startswith("```"):
-        raw = re.sub(r"^```[\w-]*\n", "", raw)
-        raw = re.sub(r"\n```$", "", raw)
-    # Strip stray quotes/backticks
-    return raw.strip().strip("`").strip('"').strip()
+# WORKSHEET_PARALLEL=1 generates each level with its own concurrent call.
+# Pages above CONTEXT_CACHE_MIN_TOKENS (estimated) are sent once, as a
+# Vertex AI context cache the three calls share. Vertex rejects caches
+# under 32,768 tokens, so smaller pages are sent inline instead.
+PARALLEL_LEVELS = os.getenv("WORKSHEET_PARALLEL", "0") == "1"
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("WORKSHEET_CONTEXT_CACHE_MIN_TOKENS", "32768"))
+CONTEXT_CACHE_TTL = int(os.getenv("WORKSHEET_CONTEXT_CACHE_TTL_SECONDS", "600"))
 
+# Structured output: the model returns JSON of exactly this shape, so the
+# response needs no cleanup before parsing.
+WORKSHEET_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "worksheets": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "level": {"type": "STRING", "enum": LEVELS},
+                    "questions": {"type": "ARRAY", "items": {"type": "STRING"}},
+                    "answers": {"type": "ARRAY", "items": {"type": "STRING"}},
+                },
+                "required": ["level", "questions", "answers"],
+                "property_ordering": ["level", "questions", "answers"],
+            },
+        },
+    },
+    "required": ["worksheets"],
+}
 
-def run_worksheet_pipeline(
-    pages: list[str],
-    grade: int,
-    subject: str,
-    num_questions: int = 5
-) -> dict:
+
+class _WorksheetScanner:
     """
-    Uses Gemini to generate JSON describing remedial/core/enrichment worksheets.
-    Returns the parsed JSON object.
+    Incremental parser for the streamed {"worksheets": [ {...}, ... ]}
+    response. `feed` returns the worksheet objects completed by the new text.
     """
-    prompt = f"""
+
+    def __init__(self):
+        self._buf = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._start = None  # offset of the current worksheet's "{"
+        self._pos = 0
+
+    def feed(self, text: str) -> list:
+        self._buf.append(text)
+        data = "".join(self._buf)
+        self._buf = [data]
+        done = []
+        for i in range(self._pos, len(data)):
+            ch = data[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+                # root {, worksheets [, then each worksheet { at depth 3
+                if ch == "{" and self._depth == 3:
+                    self._start = i
+            elif ch in "}]":
+                if ch == "}" and self._depth == 3 and self._start is not None:
+                    done.append(json.loads(data[self._start:i + 1]))
+                    self._start = None
+                self._depth -= 1
+        self._pos = len(data)
+        return done
+
+
+def _pages_block(pages: list[str]) -> str:
+    return f"""
 Inputs available:
   pages     : {json.dumps(pages, ensure_ascii=False)}
+"""
+
+
+def _task(grade: int, subject: str, num_questions: int, levels: list[str]) -> str:
+    return f"""
   grade     : {grade}
   subject   : "{subject}"
   num_questions: {num_questions}
 
 TASK:
-  • From 'pages', create three worksheets: remedial, core, enrichment.
+  • From 'pages', create {len(levels)} worksheet(s), in this order: {", ".join(levels)}.
   • For each worksheet:
       – Generate exactly {num_questions} questions.
-      – Provide their answers.
-  • Return a single JSON object, no extra text, exactly matching this shape:
-
-{{
-  "worksheets": [
-    {{
-      "level": "remedial",
-      "questions": [ "...", "...", ... ],
-      "answers":   [ "...", "...", ... ]
-    }},
-    {{
-      "level": "core",
-      "questions": [ … ],
-      "answers":   [ … ]
-    }},
-    {{
-      "level": "enrichment",
-      "questions": [ … ],
-      "answers":   [ … ]
-    }}
-  ]
-}}
+      – Provide their answers, in the same order.
+  • Return them in "worksheets", one object per level.
 
 RULES:
   • Use ONLY the content in 'pages'—do NOT invent unrelated facts.
-  • Output *only* the JSON object—no markdown, no code fences.
 """
-    logger.debug("🧠 Worksheet prompt: %s", prompt)
 
-    # Call Gemini
-    response = gemini.generate_content(prompt)
-    raw = response.text or ""
-    logger.debug("🪵 Raw Gemini response:\n%r", raw)
 
-    # Clean and parse JSON
-    cleaned = _clean_response(raw)
+def _cache_pages(pages: list[str]):
+    """
+    Puts the OCR'd pages in a Vertex AI context cache shared by the
+    per-level calls. Returns None when the pages are below the cache's
+    minimum size or caching fails; the pages are then sent inline.
+    """
+    block = _pages_block(pages)
+    if len(block) // 4 < CONTEXT_CACHE_MIN_TOKENS:
+        return None
     try:
-        parsed = json.loads(cleaned)
-    except json.JSONDecodeError:
-        # Fallback: extract JSON substring
-        m = re.search(r"(\{.*\})", cleaned, re.DOTALL)
-        if m:
-            parsed = json.loads(m.group(1))
-        else:
-            logger.error("Failed to parse JSON from Gemini response: %s", cleaned)
-            raise
+        from vertexai.preview import caching
+        from vertexai.preview.generative_models import Content, Part
+        clients.get("vertexai")
+        return caching.CachedContent.create(
+            model_name=models_for("worksheet")[0],
+            contents=[Content(role="user", parts=[Part.from_text(block)])],
+            ttl=timedelta(seconds=CONTEXT_CACHE_TTL),
+        )
+    except Exception as e:
+        logger.warning("Context cache for worksheet pages unavailable: %s", e)
+        return None
+
+
+def _generate_level(pages: list[str], grade: int, subject: str, num_questions: int, level: str, cache) -> dict:
+    task = _task(grade, subject, num_questions, [level])
+    # the cached call and the inline retry share one worksheet deadline
+    start = time.monotonic()
+    deadline = start + deadline_for("worksheet")
+    if cache is not None:
+        try:
+            resp = generate(
+                "worksheet", task, cached_content=cache, generation_config=json_config(WORKSHEET_SCHEMA),
+                deadline=start + deadline_for("worksheet") * FALLBACK_SHARE,
+            )
+            return json.loads(resp.text)["worksheets"][0]
+        except Exception as e:
+            logger.warning("Cached %s worksheet call failed (%s); sending pages inline", level, e)
+    resp = generate(
+        "worksheet", _pages_block(pages) + task, generation_config=json_config(WORKSHEET_SCHEMA), deadline=deadline
+    )
+    return json.loads(resp.text)["worksheets"][0]
+
 
-    return parsed
+def _stream_levels(pages: list[str], grade: int, subject: str, num_questions: int):
+    cache = _cache_pages(pages)
+    try:
+        with ThreadPoolExecutor(max_workers=len(LEVELS)) as ex:
+            futures = {
+                ex.submit(_generate_level, pages, grade, subject, num_questions, level, cache): level
+                for level in LEVELS
+            }
+            failed = []
+            for f in as_completed(futures):
+                try:
+                    ws = f.result()
+                except Exception:
+                    logger.exception("❌ %s worksheet failed", futures[f])
+                    failed.append(futures[f])
+                    continue
+                ws["level"] = futures[f]
+                yield ws
+            if len(failed) == len(LEVELS):
+                raise RuntimeError("Worksheet generation failed for every level")
+    finally:
+        if cache is not None:
+            try:
+                cache.delete()
+            except Exception as e:
+                logger.warning("Could not delete worksheet context cache: %s", e)
 
 
-def generate_question_pdfs(
-    worksheets: list[dict],
+def stream_worksheets(
+    pages: list[str],
     grade: int,
-    subject: str
-) -> list[tuple[str, bytes]]:
+    subject: str,
+    num_questions: int = 5,
+    parallel: bool = PARALLEL_LEVELS,
+):
     """
-    Renders a PDF for each worksheet's questions.
-    Returns a list of (filename, filebytes).
+    Generates the remedial/core/enrichment worksheets and yields each
+    {level, questions, answers} as soon as it is complete.
+
+    By default one streamed Gemini call produces all levels. With
+    `parallel`, each level is its own concurrent call sharing the pages
+    (through a context cache when they are large enough); a level that
+    fails is skipped, and only the failure of every level raises.
     """
-    pdfs = []
-    for ws in worksheets:
-        level = ws.get("level", "worksheet")
-        questions = ws.get("questions", [])
-        filename = f"{subject}_Grade{grade}_{level}_Questions.pdf"
-
-        buf = io.BytesIO()
-        c = canvas.Canvas(buf, pagesize=letter)
-        # Title
-        c.setFont("Helvetica-Bold", 14)
-        c.drawString(72, 780, f"{subject.title()} Grade {grade} – {level.title()} Questions")
-        # Questions
-        c.setFont("Helvetica", 12)
-        y = 750
-        for idx, q in enumerate(questions, start=1):
-            if y < 72:
-                c.showPage()
-                c.setFont("Helvetica", 12)
-                y = 750
-            c.drawString(72, y, f"{idx}. {q}")
-            y -= 18
-
-        c.save()
-        buf.seek(0)
-        pdfs.append((filename, buf.read()))
-    return pdfs
-
-
-def generate_answer_pdfs(
-    worksheets: list[dict],
+    if parallel:
+        yield from _stream_levels(pages, grade, subject, num_questions)
+        return
+
+    prompt = _pages_block(pages) + _task(grade, subject, num_questions, LEVELS)
+    logger.debug("🧠 Worksheet prompt: %s", prompt)
+
+    scanner = _WorksheetScanner()
+    for text in generate_stream("worksheet", prompt, generation_config=json_config(WORKSHEET_SCHEMA)):
+        for ws in scanner.feed(text):
+            logger.debug("📄 worksheet %r complete", ws.get("level"))
+            yield ws
+
+
+def run_worksheet_pipeline(
+    pages: list[str],
     grade: int,
-    subject: str
-) -> list[tuple[str, bytes]]:
+    subject: str,
+    num_questions: int = 5,
+    parallel: bool = PARALLEL_LEVELS,
+) -> dict:
     """
-    Renders a PDF for each worksheet's answers.
-    Returns a list of (filename, filebytes).
+    Uses Gemini to generate JSON describing remedial/core/enrichment worksheets.
+    Returns {"worksheets": [ {level, questions, answers}, … ]}, in level
+    order, plus "missing": [levels] when some levels could not be generated.
     """
-    pdfs = []
-    for ws in worksheets:
-        level = ws.get("level", "worksheet")
-        answers = ws.get("answers", [])
-        filename = f"{subject}_Grade{grade}_{level}_Answers.pdf"
-
-        buf = io.BytesIO()
-        c = canvas.Canvas(buf, pagesize=letter)
-        # Title
-        c.setFont("Helvetica-Bold", 14)
-        c.drawString(72, 780, f"{subject.title()} Grade {grade} – {level.title()} Answers")
-        # Answers
-        c.setFont("Helvetica", 12)
-        y = 750
-        for idx, a in enumerate(answers, start=1):
-            if y < 72:
-                c.showPage()
-                c.setFont("Helvetica", 12)
-                y = 750
-            c.drawString(72, y, f"{idx}. {a}")
-            y -= 18
-
-        c.save()
-        buf.seek(0)
-        pdfs.append((filename, buf.read()))
-    return pdfs
+    got = {ws["level"]: ws for ws in stream_worksheets(pages, grade, subject, num_questions, parallel)}
+    result = {"worksheets": [got[level] for level in LEVELS if level in got]}
+    missing = [level for level in LEVELS if level not in got]
+    if missing:
+        result["missing"] = missing
+    return result
 
 
 def generate_worksheets_zip(
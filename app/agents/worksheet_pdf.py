@@ -0,0 +1,74 @@
+# app/agents/worksheet_pdf.py
+#
+# PDF rendering for worksheets. Kept free of Vertex AI / Google client
+# imports so the /worksheets/zip process pool can load it cheaply.
+
+import io
+
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import letter
+
+KINDS = {"questions": "Questions", "answers": "Answers"}
+
+
+def pdf_filename(kind: str, level: str, grade: int, subject: str) -> str:
+    return f"{subject}_Grade{grade}_{level}_{KINDS[kind]}.pdf"
+
+
+def render_pdf(kind: str, ws: dict, grade: int, subject: str) -> bytes:
+    """
+    Renders one worksheet's "questions" or "answers" as a PDF.
+    """
+    level = ws.get("level", "worksheet")
+    items = ws.get(kind, [])
+
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=letter)
+    # Title
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(72, 780, f"{subject.title()} Grade {grade} – {level.title()} {KINDS[kind]}")
+    # Items
+    c.setFont("Helvetica", 12)
+    y = 750
+    for idx, item in enumerate(items, start=1):
+        if y < 72:
+            c.showPage()
+            c.setFont("Helvetica", 12)
+            y = 750
+        c.drawString(72, y, f"{idx}. {item}")
+        y -= 18
+
+    c.save()
+    return buf.getvalue()
+
+
+def generate_question_pdfs(
+    worksheets: list[dict],
+    grade: int,
+    subject: str
+) -> list[tuple[str, bytes]]:
+    """
+    Renders a PDF for each worksheet's questions.
+    Returns a list of (filename, filebytes).
+    """
+    return [
+        (pdf_filename("questions", ws.get("level", "worksheet"), grade, subject),
+         render_pdf("questions", ws, grade, subject))
+        for ws in worksheets
+    ]
+
+
+def generate_answer_pdfs(
+    worksheets: list[dict],
+    grade: int,
+    subject: str
+) -> list[tuple[str, bytes]]:
+    """
+    Renders a PDF for each worksheet's answers.
+    Returns a list of (filename, filebytes).
+    """
+    return [
+        (pdf_filename("answers", ws.get("level", "worksheet"), grade, subject),
+         render_pdf("answers", ws, grade, subject))
+        for ws in worksheets
+    ]
@@ -0,0 +1,85 @@
+# app/agents/worksheet_zip.py
+
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from zipfile import ZipFile, ZIP_DEFLATED
+
+from app.cache import TieredCache
+from app.concurrency import run_cpu
+from .worksheet_pdf import KINDS, pdf_filename, render_pdf
+
+logger = logging.getLogger("app.agents.worksheet_zip")
+
+# Rendered PDFs keyed on a hash of (kind, worksheet JSON, grade, subject), so
+# downloading and then publishing the same worksheets renders them once.
+_cache = TieredCache(
+    "worksheet_pdf",
+    memory_size=int(os.getenv("WORKSHEET_PDF_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    ttl=int(os.getenv("WORKSHEET_PDF_CACHE_TTL_SECONDS", str(86400))),
+    disk=os.getenv("WORKSHEET_PDF_CACHE_DISK", "0") == "1",
+    getsizeof=len,
+)
+
+
+def pdf_key(kind: str, ws: dict, grade: int, subject: str) -> str:
+    blob = json.dumps([kind, ws, grade, subject], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+async def worksheet_pdf(kind: str, ws: dict, grade: int, subject: str) -> bytes:
+    """
+    One worksheet PDF, from the cache or rendered in the process pool.
+    """
+    key = pdf_key(kind, ws, grade, subject)
+    pdf = _cache.get(key)
+    if pdf is None:
+        pdf = await run_cpu(render_pdf, kind, ws, grade, subject)
+        _cache.set(key, pdf)
+    return pdf
+
+
+class _Sink:
+    """
+    Write-only file for ZipFile; `drain` hands back what was written so far.
+    Without tell()/seek() ZipFile writes data descriptors and never rewinds.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        out, self._chunks = b"".join(self._chunks), []
+        return out
+
+
+async def stream_worksheets_zip(worksheets: list, grade: int, subject: str):
+    """
+    Yields a ZIP with the question and answer PDFs of every worksheet.
+    All PDFs render concurrently; each entry is streamed as soon as it and
+    the entries before it are ready.
+    """
+    jobs = [
+        (pdf_filename(kind, ws.get("level", "worksheet"), grade, subject),
+         asyncio.ensure_future(worksheet_pdf(kind, ws, grade, subject)))
+        for kind in KINDS for ws in worksheets
+    ]
+    sink = _Sink()
+    try:
+        with ZipFile(sink, "w", ZIP_DEFLATED) as zf:
+            for filename, job in jobs:
+                zf.writestr(filename, await job)
+                yield sink.drain()
+        yield sink.drain()
+    finally:
+        for _, job in jobs:
+            job.cancel()
@@ -0,0 +1,209 @@
+# app/cache.py
+
+import os
+import time
+import pickle
+import sqlite3
+import logging
+import threading
+
+from cachetools import TTLCache
+
+from app import metrics
+
+logger = logging.getLogger("app.cache")
+
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.getcwd(), ".cache"))
+
+
+class MemoryStore:
+    """
+    In-process key/value store with LRU eviction and a per-entry TTL.
+    Values are kept as-is (no copy, no pickling). With `getsizeof`, `maxsize`
+    bounds the summed size of the values instead of their count.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, getsizeof=None):
+        self._data = TTLCache(maxsize=maxsize, ttl=ttl, getsizeof=getsizeof)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            return self._data.get(key)
+
+    def set(self, key: str, value) -> None:
+        with self._lock:
+            try:
+                self._data[key] = value
+            except ValueError:  # larger than the whole cache
+                pass
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def scan(self, prefix: str, limit: int = None) -> list:
+        """
+        (key, value) pairs whose key starts with `prefix`; with `limit`, only
+        the most recently stored ones (TTLCache keeps no read order).
+        """
+        with self._lock:
+            self._data.expire()
+            found = [(k, v) for k, v in self._data.items() if k.startswith(prefix)]
+        return found[-limit:] if limit else found
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class DiskStore:
+    """
+    Local on-disk key/value store (SQLite, WAL mode) that several uvicorn
+    workers on the same host can share. Values are pickled. Keeps at most
+    `maxsize` entries, evicting the least recently read ones.
+    """
+
+    def __init__(self, path: str, maxsize: int, ttl: float):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._max = maxsize
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL,"
+            " expires REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM entries WHERE key = ? AND expires > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        return pickle.loads(row[0])
+
+    def set(self, key: str, value) -> None:
+        now = time.time()
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                (key, blob, now + self._ttl, now),
+            )
+            self._conn.execute("DELETE FROM entries WHERE expires <= ?", (now,))
+            self._conn.execute(
+                "DELETE FROM entries WHERE key IN ("
+                " SELECT key FROM entries ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self._max,),
+            )
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def scan(self, prefix: str, limit: int = None) -> list:
+        """
+        (key, value) pairs whose key starts with `prefix`; with `limit`, only
+        the most recently read ones.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM entries WHERE key >= ? AND key < ? AND expires > ?"
+                " ORDER BY accessed DESC LIMIT ?",
+                (prefix, prefix + "\uffff", time.time(), limit or -1),
+            ).fetchall()
+        return [(k, pickle.loads(v)) for k, v in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+def make_store(name: str, backend: str, maxsize: int, ttl: float):
+    """
+    Builds the store for cache `name`: "memory" (default) or "disk", which
+    lives at CACHE_DIR/<name>.sqlite3.
+    """
+    if backend == "disk":
+        path = os.path.join(CACHE_DIR, f"{name}.sqlite3")
+        logger.info("💾 %s cache on disk at %s", name, path)
+        return DiskStore(path, maxsize=maxsize, ttl=ttl)
+    return MemoryStore(maxsize=maxsize, ttl=ttl)
+
+
+class TieredCache:
+    """
+    A bounded in-memory tier in front of an optional local disk tier.
+    Disk hits are promoted to memory. Hits per tier, misses and the bytes
+    callers report as saved are published on GET /metrics as "<name>_cache".
+    """
+
+    def __init__(self, name: str, memory_size: int, ttl: float, disk: bool = False,
+                 disk_size: int = None, getsizeof=None):
+        self.name = name
+        self.memory = MemoryStore(memory_size, ttl, getsizeof=getsizeof)
+        self.disk = (
+            DiskStore(os.path.join(CACHE_DIR, f"{name}.sqlite3"), disk_size or memory_size * 10, ttl)
+            if disk else None
+        )
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bytes_saved": 0}
+        self._lock = threading.Lock()
+        metrics.register(f"{name}_cache", self.snapshot)
+
+    def _count(self, field: str, saved: int = 0) -> None:
+        with self._lock:
+            self._stats[field] += 1
+            self._stats["bytes_saved"] += saved
+
+    def get(self, key: str, saved: int = 0):
+        """
+        Returns the cached value or None. `saved` is the number of bytes a
+        hit avoids sending upstream, for reporting only.
+        """
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory_hits", saved)
+            return value
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+                self._count("disk_hits", saved)
+                return value
+        self._count("misses")
+        return None
+
+    def peek(self, key: str):
+        """Like get(), but not counted in the stats."""
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+        return value
+
+    def note_saved(self, saved: int) -> None:
+        with self._lock:
+            self._stats["bytes_saved"] += saved
+
+    def set(self, key: str, value) -> None:
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            snap = dict(self._stats)
+        lookups = snap["memory_hits"] + snap["disk_hits"] + snap["misses"]
+        snap["memory_hit_rate"] = round(snap["memory_hits"] / lookups, 4) if lookups else 0.0
+        snap["disk_hit_rate"] = round(snap["disk_hits"] / lookups, 4) if lookups else 0.0
+        snap["memory_entries"] = len(self.memory)
+        if self.disk is not None:
+            snap["disk_entries"] = len(self.disk)
+        return snap
@@ -0,0 +1,136 @@
+# app/clients.py
+
+import os
+import time
+import asyncio
+import logging
+import threading
+
+from app import metrics
+from app.concurrency import run_blocking
+
+logger = logging.getLogger("app.clients")
+
+# Process-wide Google clients. Nothing is built at import time: each client
+# is created on first use, or ahead of time by `warm()` from the startup
+# hook. CLIENTS_WARM selects what the hook does:
+#   background (default) - warm all clients concurrently without delaying startup
+#   blocking             - finish warming before the app takes requests
+#   off                  - build each client on first use only
+WARM = os.getenv("CLIENTS_WARM", "background")
+
+# ─── Factories ───────────────────────────────────────────────────────────────
+# Imports are local so importing this module stays cheap.
+
+def _vertexai():
+    import vertexai
+    vertexai.init(
+        project=os.environ["GOOGLE_CLOUD_PROJECT"],
+        location=os.environ["GOOGLE_CLOUD_LOCATION"],
+    )
+    return vertexai
+
+
+def _firestore():
+    from app.datastore import build_client
+    return build_client()
+
+
+def _vision():
+    from google.cloud import vision
+    return vision.ImageAnnotatorClient()
+
+
+def _firebase():
+    from app.deps import init_firebase
+    return init_firebase()
+
+
+def _calendar_credentials():
+    from google.oauth2 import service_account
+    from app.agents.calendar_tool import SCOPES
+    return service_account.Credentials.from_service_account_file(
+        os.environ["GOOGLE_APPLICATION_CREDENTIALS"], scopes=SCOPES
+    )
+
+
+def _imagen():
+    get("vertexai")
+    from vertexai.preview.vision_models import ImageGenerationModel
+    return ImageGenerationModel.from_pretrained("imagen-4.0-generate-preview-06-06")
+
+
+_factories = {
+    "vertexai": _vertexai,
+    "firestore": _firestore,
+    "vision": _vision,
+    "firebase": _firebase,
+    "calendar_credentials": _calendar_credentials,
+    "imagen": _imagen,
+}
+
+_clients = {}
+_locks = {name: threading.Lock() for name in _factories}
+_init_ms = {}  # name -> milliseconds its factory took
+
+
+def get(name: str):
+    """
+    The shared client `name`, built on first call. Concurrent first calls
+    wait for a single build.
+    """
+    client = _clients.get(name)
+    if client is None:
+        with _locks[name]:
+            client = _clients.get(name)
+            if client is None:
+                t0 = time.perf_counter()
+                client = _clients[name] = _factories[name]()
+                _init_ms[name] = round((time.perf_counter() - t0) * 1e3, 1)
+                logger.info("🔌 %s client ready in %.0fms", name, _init_ms[name])
+    return client
+
+
+class Lazy:
+    """
+    Stands in for client `name` where an object is needed at import time
+    (e.g. a module-level `db`); the client is built on first attribute access.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(get(self._name), attr)
+
+    def __repr__(self):
+        return f"<lazy {self._name} client>"
+
+
+async def warm(names=None) -> dict:
+    """
+    Builds the given clients (all by default) concurrently on the "clients"
+    pool. Returns {name: ms or error}; failures are logged, not raised, so
+    the client is retried on first use.
+    """
+    names = list(names or _factories)
+
+    async def one(name):
+        try:
+            await run_blocking("clients", get, name)
+            return _init_ms.get(name, 0.0)
+        except Exception as e:
+            logger.warning("client %s not warmed: %s", name, e)
+            return f"error: {e}"
+
+    t0 = time.perf_counter()
+    results = dict(zip(names, await asyncio.gather(*(one(n) for n in names))))
+    logger.info("🔌 warmed %d clients in %.0fms", len(names), (time.perf_counter() - t0) * 1e3)
+    return results
+
+
+def snapshot() -> dict:
+    return {"ready": sorted(_clients), "init_ms": dict(_init_ms), "warm": WARM}
+
+
+metrics.register("clients", snapshot)
@@ -0,0 +1,133 @@
+# app/concurrency.py
+
+import os
+import asyncio
+import logging
+import functools
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+logger = logging.getLogger("app.concurrency")
+
+# Each blocking client gets its own bounded thread pool, so a burst of slow
+# Imagen calls can only tie up the "imagen" workers and never starves
+# Firestore or Vision. Limits are overridable per pool, e.g. IMAGEN_MAX_CONCURRENCY=2.
+_DEFAULT_LIMITS = {
+    "firestore": 32,
+    "firebase_auth": 16,
+    "gcs": 16,
+    "vision": 16,
+    "gemini": 16,
+    "imagen": 4,
+    "plantuml": 4,
+    "calendar": 4,
+    "response_cache": 8,
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+# CPU-bound work (PDF rendering) runs in worker processes, off the GIL.
+# Spawned rather than forked: the parent already runs gRPC and other threads.
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+_cpu_pool = None
+
+
+def pool_limit(name: str) -> int:
+    return int(os.getenv(f"{name.upper()}_MAX_CONCURRENCY", _DEFAULT_LIMITS.get(name, 8)))
+
+
+def _pool(name: str) -> ThreadPoolExecutor:
+    pool = _pools.get(name)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(name)
+            if pool is None:
+                pool = ThreadPoolExecutor(max_workers=pool_limit(name), thread_name_prefix=f"{name}-io")
+                _pools[name] = pool
+                logger.info("🧵 executor %r started with %d workers", name, pool._max_workers)
+    return pool
+
+
+async def run_blocking(pool: str, fn, *args, **kwargs):
+    """
+    Runs the blocking callable `fn(*args, **kwargs)` on the named bounded
+    executor and awaits its result without blocking the event loop.
+    Calls beyond the pool's limit queue until a worker is free.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool(pool), functools.partial(fn, *args, **kwargs))
+
+
+async def iterate_blocking(pool: str, gen_fn, *args, **kwargs):
+    """
+    Drives the blocking generator `gen_fn(*args, **kwargs)` on the named
+    executor and yields its items as they are produced. An exception raised
+    by the generator is re-raised here.
+
+    When the consumer stops early (e.g. the SSE client went away), the
+    generator is closed after the item it is producing, which frees the
+    worker instead of running the generator to the end.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    done = object()
+    stop = threading.Event()
+
+    def drive():
+        gen = gen_fn(*args, **kwargs)
+        try:
+            for item in gen:
+                if stop.is_set():
+                    return
+                loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+        except BaseException as e:
+            if not stop.is_set():
+                loop.call_soon_threadsafe(queue.put_nowait, (done, e))
+        else:
+            loop.call_soon_threadsafe(queue.put_nowait, (done, None))
+        finally:
+            if hasattr(gen, "close"):
+                gen.close()
+
+    fut = loop.run_in_executor(_pool(pool), drive)
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is done:
+                await fut
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+async def run_cpu(fn, *args):
+    """
+    Runs the picklable top-level function `fn(*args)` in the shared process
+    pool and awaits its result.
+    """
+    global _cpu_pool
+    if _cpu_pool is None:
+        with _pools_lock:
+            if _cpu_pool is None:
+                _cpu_pool = ProcessPoolExecutor(
+                    max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context("spawn")
+                )
+                logger.info("🧵 process pool started with %d workers", CPU_WORKERS)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_cpu_pool, fn, *args)
+
+
+def shutdown_executors() -> None:
+    global _cpu_pool
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _pools.clear()
+        if _cpu_pool is not None:
+            _cpu_pool.shutdown(wait=False, cancel_futures=True)
+            _cpu_pool = None
@@ -0,0 +1,239 @@
+# app/datastore.py
+
+import os
+import logging
+import itertools
+import threading
+from collections import Counter
+from typing import Optional
+
+import grpc
+from google.cloud import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+from google.cloud.firestore_v1.services.firestore import client as firestore_client
+from google.cloud.firestore_v1.services.firestore.transports.grpc import FirestoreGrpcTransport
+
+from app import metrics
+
+logger = logging.getLogger("app.datastore")
+
+# ─── Shared Firestore client ─────────────────────────────────────────────────
+# One client per process serves the router, chat history, calendar jobs and
+# get_db(). Its gRPC traffic goes over FIRESTORE_CHANNELS channels (HTTP/2
+# connections), picked round-robin per call, with these channel settings.
+FIRESTORE_DATABASE = os.getenv("FIRESTORE_DATABASE") or None
+CHANNELS = max(1, int(os.getenv("FIRESTORE_CHANNELS", "1")))
+CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", int(os.getenv("FIRESTORE_GRPC_KEEPALIVE_MS", "30000"))),
+    ("grpc.keepalive_timeout_ms", int(os.getenv("FIRESTORE_GRPC_KEEPALIVE_TIMEOUT_MS", "10000"))),
+    # keep connections of an idle instance open, so the next request skips the handshake
+    ("grpc.keepalive_permit_without_calls", int(os.getenv("FIRESTORE_GRPC_KEEPALIVE_IDLE", "0"))),
+    ("grpc.max_send_message_length", -1),
+    ("grpc.max_receive_message_length", -1),
+]
+
+_rpcs = Counter()  # gRPC method -> calls
+_rpcs_lock = threading.Lock()
+
+
+class _CountRpcs(grpc.UnaryUnaryClientInterceptor, grpc.UnaryStreamClientInterceptor):
+    """
+    Counts the round trips made per Firestore method.
+    """
+
+    def _count(self, details):
+        with _rpcs_lock:
+            _rpcs[details.method.rsplit("/", 1)[-1]] += 1
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        self._count(client_call_details)
+        return continuation(client_call_details, request)
+
+    def intercept_unary_stream(self, continuation, client_call_details, request):
+        self._count(client_call_details)
+        return continuation(client_call_details, request)
+
+
+class _Pick:
+    """
+    A multi-callable that sends each call down the next channel.
+    """
+
+    def __init__(self, callables):
+        self._next = itertools.cycle(callables).__next__
+
+    def __call__(self, *args, **kwargs):
+        return self._next()(*args, **kwargs)
+
+    def __getattr__(self, name):  # with_call, future
+        return getattr(self._next(), name)
+
+
+class _RoundRobin(grpc.Channel):
+    def __init__(self, channels):
+        self._channels = channels
+
+    def unary_unary(self, *args, **kwargs):
+        return _Pick([c.unary_unary(*args, **kwargs) for c in self._channels])
+
+    def unary_stream(self, *args, **kwargs):
+        return _Pick([c.unary_stream(*args, **kwargs) for c in self._channels])
+
+    def stream_unary(self, *args, **kwargs):
+        return _Pick([c.stream_unary(*args, **kwargs) for c in self._channels])
+
+    def stream_stream(self, *args, **kwargs):
+        return _Pick([c.stream_stream(*args, **kwargs) for c in self._channels])
+
+    def subscribe(self, callback, try_to_connect=False):
+        for c in self._channels:
+            c.subscribe(callback, try_to_connect)
+
+    def unsubscribe(self, callback):
+        for c in self._channels:
+            c.unsubscribe(callback)
+
+    def close(self):
+        for c in self._channels:
+            c.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+# firestore.Client takes no transport, so PooledClient replaces the private
+# _firestore_api that builds it. That hook is only trusted on the library
+# version it was written against (pinned in requirements.txt); on any other,
+# build_client falls back to a plain client.
+POOLED_FIRESTORE_VERSION = "2.21."
+
+
+def _can_pool() -> bool:
+    from google.cloud.firestore_v1 import base_client
+
+    if not firestore.__version__.startswith(POOLED_FIRESTORE_VERSION):
+        return False
+    return (
+        isinstance(getattr(firestore.Client, "_firestore_api", None), property)
+        and hasattr(base_client.BaseClient, "_firestore_api_internal")
+        and isinstance(getattr(base_client.BaseClient, "_target", None), property)
+    )
+
+
+class PooledClient(firestore.Client):
+    """
+    firestore.Client whose API calls go over our own channel pool, set up
+    with CHANNEL_OPTIONS and counted per method.
+    """
+
+    @property
+    def _firestore_api(self):
+        if self._firestore_api_internal is None:
+            channels = [self._channel(i) for i in range(CHANNELS)]
+            channel = grpc.intercept_channel(
+                channels[0] if CHANNELS == 1 else _RoundRobin(channels), _CountRpcs()
+            )
+            self._transport = FirestoreGrpcTransport(
+                host=self._target, channel=channel, client_info=self._client_info
+            )
+            self._firestore_api_internal = firestore_client.FirestoreClient(
+                transport=self._transport, client_options=self._client_options, client_info=self._client_info
+            )
+            logger.info("🔥 Firestore client on %d channel(s) to %s", CHANNELS, self._target)
+        return self._firestore_api_internal
+
+    def _channel(self, i: int) -> grpc.Channel:
+        # a local subchannel pool gives each channel its own connection
+        options = CHANNEL_OPTIONS + ([("grpc.use_local_subchannel_pool", 1)] if CHANNELS > 1 else [])
+        if self._emulator_host is not None:
+            return grpc.insecure_channel(self._emulator_host, options=options)
+        return FirestoreGrpcTransport.create_channel(self._target, credentials=self._credentials, options=options)
+
+
+def build_client() -> firestore.Client:
+    """
+    The shared client: a PooledClient, or a plain firestore.Client (default
+    channel, no round-trip counts) when this google-cloud-firestore is not
+    one PooledClient was written for.
+    """
+    kwargs = {"project": os.getenv("GOOGLE_CLOUD_PROJECT"), "database": FIRESTORE_DATABASE}
+    if _can_pool():
+        return PooledClient(**kwargs)
+    logger.warning(
+        "⚠️ PooledClient does not support google-cloud-firestore %s; using the default channel",
+        firestore.__version__,
+    )
+    return firestore.Client(**kwargs)
+
+
+def round_trips() -> dict:
+    """
+    Firestore calls made by this process so far, by method.
+    """
+    with _rpcs_lock:
+        return dict(_rpcs)
+
+
+def _metrics() -> dict:
+    trips = round_trips()
+    return {"channels": CHANNELS, "round_trips": sum(trips.values()), "by_method": trips}
+
+
+metrics.register("firestore", _metrics)
+
+
+# ─── Resources ───────────────────────────────────────────────────────────────
+# The `resources` collection: published worksheets and diagrams. Blocking;
+# call these on the "firestore" pool. Filtering by type or tag needs the
+# composite indexes in firestore.indexes.json
+# (`firebase deploy --only firestore:indexes`).
+
+def create_resource(db: firestore.Client, resource_id: str, doc: dict) -> None:
+    db.collection("resources").document(resource_id).set(doc)
+
+
+def get_resource(db: firestore.Client, resource_id: str) -> Optional[dict]:
+    """
+    The resource document, or None if it does not exist.
+    """
+    snap = db.collection("resources").document(resource_id).get()
+    return snap.to_dict() if snap.exists else None
+
+
+def list_resources(
+    db: firestore.Client,
+    limit: Optional[int],
+    cursor: Optional[str] = None,
+    type: Optional[str] = None,
+    tag: Optional[str] = None,
+    fields: Optional[list] = None,
+):
+    """
+    One page of resources, newest first, as ([(id, data)], next_cursor);
+    every resource (and no next_cursor) when `limit` is None. `cursor` is
+    the id of the last resource of the previous page; raises ValueError if
+    it does not exist.
+    """
+    q = db.collection("resources")
+    if type:
+        q = q.where(filter=FieldFilter("type", "==", type))
+    if tag:
+        q = q.where(filter=FieldFilter("tags", "array_contains", tag))
+    q = q.order_by("created_at", direction=firestore.Query.DESCENDING)
+    if fields:
+        q = q.select(fields)
+    if cursor:
+        last = db.collection("resources").document(cursor).get()
+        if not last.exists:
+            raise ValueError("Invalid cursor")
+        q = q.start_after(last)
+
+    if limit:
+        q = q.limit(limit)
+    docs = list(q.stream())
+    next_cursor = docs[-1].id if limit and len(docs) == limit else None
+    return [(d.id, d.to_dict()) for d in docs], next_cursor
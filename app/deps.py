@@ -1,19 +1,27 @@
 # app/deps.py
 
 import os
+import time
+import asyncio
+import hashlib
+import threading
+from collections import deque
 from functools import lru_cache
 
-from fastapi import Depends, HTTPException, status
+from cachetools import TLRUCache
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 import firebase_admin
 from firebase_admin import (
     auth as firebase_auth,
     credentials,
-    firestore,
     storage as firebase_storage,
 )
 
+from app import clients, metrics
+from app.concurrency import run_blocking
+
 security_scheme = HTTPBearer(auto_error=False)
 
 @lru_cache()
@@ -45,10 +53,9 @@ def init_firebase():
 
 def get_db():
     """
-    Dependency to get a Firestore client.
+    Dependency to get the process-wide Firestore client (app.datastore).
     """
-    init_firebase()
-    return firestore.client()
+    return clients.get("firestore")
 
 def get_bucket():
     """
@@ -68,11 +75,79 @@ def get_bucket():
             "and no default storage bucket was configured."
         )
 
+# ─── ID token verification ───────────────────────────────────────────────────
+# Verified tokens are cached by their sha256 until they expire (`exp`), so a
+# known token skips verification. Revocation and disabled accounts are
+# re-checked at most every AUTH_REVOCATION_CHECK_SECONDS per token. The
+# signing keys are cached by firebase_admin itself, per their Cache-Control.
+AUTH_CACHE_ENTRIES = int(os.getenv("AUTH_CACHE_ENTRIES", "10000"))
+REVOCATION_CHECK_SECONDS = int(os.getenv("AUTH_REVOCATION_CHECK_SECONDS", "300"))
+
+
+def _until_exp(key, entry, now):
+    # TLRUCache times with time.monotonic; `exp` is epoch seconds
+    return now + entry["claims"]["exp"] - time.time()
+
+
+_tokens = TLRUCache(maxsize=AUTH_CACHE_ENTRIES, ttu=_until_exp)
+_tokens_lock = threading.Lock()
+_inflight = {}  # token hash -> verification task, shared by concurrent requests
+_auth_stats = {"hits": 0, "misses": 0, "revocation_checks": 0, "rejected": 0}
+_auth_ms = deque(maxlen=1000)
+
+
+async def _verify(id_token: str) -> dict:
+    key = hashlib.sha256(id_token.encode("utf-8")).hexdigest()
+    with _tokens_lock:
+        entry = _tokens.get(key)
+    if entry is not None and time.time() - entry["checked"] < REVOCATION_CHECK_SECONDS:
+        _auth_stats["hits"] += 1
+        return entry["claims"]
+    _auth_stats["revocation_checks" if entry is not None else "misses"] += 1
+
+    task = _inflight.get(key)
+    if task is None:
+        task = _inflight[key] = asyncio.ensure_future(_check(key, id_token))
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    return await asyncio.shield(task)
+
+
+async def _check(key: str, id_token: str) -> dict:
+    checked = time.time()
+    try:
+        claims = await run_blocking(
+            "firebase_auth", firebase_auth.verify_id_token, id_token, check_revoked=True,
+        )
+    except Exception:
+        with _tokens_lock:
+            _tokens.pop(key, None)
+        raise
+    with _tokens_lock:
+        _tokens[key] = {"claims": claims, "checked": checked}
+    return claims
+
+
+def _auth_metrics() -> dict:
+    with _tokens_lock:
+        cached = len(_tokens)
+    samples = sorted(_auth_ms)
+    out = {**_auth_stats, "cached_tokens": cached}
+    if samples:
+        out.update({f"p{int(q * 100)}_ms": round(samples[min(len(samples) - 1, int(len(samples) * q))], 2)
+                    for q in (0.5, 0.95, 0.99)})
+    return out
+
+
+metrics.register("auth", _auth_metrics)
+
+
 async def get_current_user(
+    request: Request,
     token: HTTPAuthorizationCredentials = Depends(security_scheme)
 ):
     """
     Dependency to verify Firebase ID token (or return a dev stub if none provided).
+    The time spent is left in request.state.auth_ms for the Server-Timing header.
     """
     init_firebase()
 
@@ -80,13 +155,15 @@ async def get_current_user(
     if token is None:
         return {"uid": "dev-user", "email": "dev@example.com"}
 
+    t0 = time.perf_counter()
     try:
-        decoded = firebase_auth.verify_id_token(
-            token.credentials, check_revoked=True
-        )
-        return decoded
+        return await _verify(token.credentials)
     except Exception:
+        _auth_stats["rejected"] += 1
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired token",
         )
+    finally:
+        request.state.auth_ms = (time.perf_counter() - t0) * 1e3
+        _auth_ms.append(request.state.auth_ms)
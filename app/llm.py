@@ -0,0 +1,398 @@
+# app/llm.py
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import AsyncGenerator, List
+
+from google.adk.models import BaseLlm, Gemini, LlmRequest, LlmResponse
+
+from app import clients, metrics
+
+logger = logging.getLogger("app.llm")
+
+PRO = "gemini-2.5-pro"
+FLASH = "gemini-2.5-flash"
+
+# ─── Per-agent configuration ─────────────────────────────────────────────────
+# Each agent has a model chain: the first model is tried first and the next
+# one is used if it fails or runs out of its share of the deadline.
+# Override with LLM_MODEL_<AGENT>="model-a,model-b".
+_DEFAULT_MODELS = {
+    "intent": [FLASH, PRO],
+    "mindmap": [FLASH, PRO],
+    "quiz": [FLASH, PRO],
+    "history_summary": [FLASH],
+}
+# Seconds for the whole call, fallbacks included. LLM_DEADLINE_<AGENT>.
+_DEFAULT_DEADLINES = {
+    "intent": 10,
+    "mindmap": 45,
+    "lesson_plan": 90,
+    "worksheet": 120,
+    "autoeval": 90,
+    "history_summary": 30,
+}
+DEFAULT_DEADLINE = float(os.getenv("LLM_DEFAULT_DEADLINE", "60"))
+# Share of the remaining deadline a model gets when a fallback follows it.
+FALLBACK_SHARE = 0.5
+
+# Hedging sends a second identical request once the first has been running
+# longer than the agent's p95 latency. Only one-shot, idempotent calls are
+# hedged, never streams. LLM_HEDGE_AGENTS="intent,mindmap" picks the agents.
+HEDGE_AGENTS = {a.strip() for a in os.getenv("LLM_HEDGE_AGENTS", "").split(",") if a.strip()}
+HEDGE_MIN_SAMPLES = 20
+HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "8"))
+
+
+def models_for(agent: str) -> List[str]:
+    env = os.getenv(f"LLM_MODEL_{agent.upper()}")
+    if env:
+        return [m.strip() for m in env.split(",") if m.strip()]
+    return _DEFAULT_MODELS.get(agent, [PRO])
+
+
+def deadline_for(agent: str) -> float:
+    return float(os.getenv(f"LLM_DEADLINE_{agent.upper()}", _DEFAULT_DEADLINES.get(agent, DEFAULT_DEADLINE)))
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+# ─── Latency stats ───────────────────────────────────────────────────────────
+
+_lock = threading.Lock()
+_latency = {}  # agent -> deque of seconds for successful calls
+_counts = {}   # agent -> {calls, errors, timeouts, hedged, hedge_wins, fallbacks}
+
+
+def _count(agent: str, key: str) -> None:
+    with _lock:
+        c = _counts.setdefault(agent, dict.fromkeys(
+            ("calls", "errors", "timeouts", "hedged", "hedge_wins", "fallbacks"), 0
+        ))
+        c[key] += 1
+
+
+def _record(agent: str, seconds: float) -> None:
+    with _lock:
+        _latency.setdefault(agent, deque(maxlen=1000)).append(seconds)
+    _count(agent, "calls")
+
+
+def _percentile(samples: list, q: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def _hedge_delay(agent: str):
+    if agent not in HEDGE_AGENTS:
+        return None
+    with _lock:
+        samples = sorted(_latency.get(agent, ()))
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY
+    return _percentile(samples, 0.95)
+
+
+def snapshot() -> dict:
+    out = {"abandoned_calls": _abandoned}
+    with _lock:
+        for agent, c in _counts.items():
+            samples = sorted(_latency.get(agent, ()))
+            out[agent] = dict(c)
+            if samples:
+                out[agent].update({
+                    f"p{int(q * 100)}_ms": round(_percentile(samples, q) * 1000, 1)
+                    for q in (0.5, 0.95, 0.99)
+                })
+    return out
+
+
+metrics.register("llm", snapshot)
+
+
+# ─── Blocking calls (vertexai GenerativeModel) ───────────────────────────────
+# vertexai is imported on first use, not with this module, to keep startup fast.
+
+_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("LLM_MAX_CONCURRENCY", "32")), thread_name_prefix="llm"
+)
+# A call given up on (timed out, or beaten by its hedge) cannot be interrupted
+# and keeps its pool thread until the SDK returns. Queued ones are cancelled;
+# while LLM_MAX_ABANDONED running ones are outstanding, no hedges are sent.
+MAX_ABANDONED = int(os.getenv("LLM_MAX_ABANDONED", "8"))
+_abandoned = 0
+_models = {}
+_json_configs = {}
+
+
+def _model(name: str):
+    model = _models.get(name)
+    if model is None:
+        from vertexai.preview.generative_models import GenerativeModel
+        clients.get("vertexai")
+        model = _models[name] = GenerativeModel(name)
+    return model
+
+
+def json_config(schema: dict):
+    """
+    GenerationConfig for JSON output following `schema` (built once per schema).
+    """
+    config = _json_configs.get(id(schema))
+    if config is None:
+        from vertexai.preview.generative_models import GenerationConfig
+        config = _json_configs[id(schema)] = GenerationConfig(
+            response_mime_type="application/json", response_schema=schema
+        )
+    return config
+
+
+def _release(futures) -> None:
+    global _abandoned
+    for f in futures:
+        if f.cancel():
+            continue
+        with _lock:
+            _abandoned += 1
+        f.add_done_callback(_unabandon)
+
+
+def _unabandon(_) -> None:
+    global _abandoned
+    with _lock:
+        _abandoned -= 1
+
+
+def _attempt(agent: str, call, budget: float):
+    """
+    Runs `call` on the LLM pool, hedging it if configured, and returns the
+    first successful result within `budget` seconds. Calls still pending
+    when it returns are released (see MAX_ABANDONED).
+    """
+    start = time.monotonic()
+    end = start + budget
+    hedge_at = _hedge_delay(agent)
+    pending = {_pool.submit(call)}
+    hedge = None
+    error = None
+    try:
+        while pending and time.monotonic() < end:
+            wake = end if hedge or hedge_at is None else min(end, start + hedge_at)
+            done, pending = wait(pending, timeout=max(0.0, wake - time.monotonic()), return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    _record(agent, time.monotonic() - start)
+                    if f is hedge:
+                        _count(agent, "hedge_wins")
+                    return f.result()
+                error = f.exception()
+            if pending and hedge is None and hedge_at is not None and time.monotonic() >= start + hedge_at:
+                hedge_at = None
+                if _abandoned < MAX_ABANDONED:
+                    hedge = _pool.submit(call)
+                    pending.add(hedge)
+                    _count(agent, "hedged")
+    finally:
+        _release(pending)
+    if error is not None and not pending:
+        _count(agent, "errors")
+        raise error
+    _count(agent, "timeouts")
+    raise DeadlineExceeded(f"{agent}: no response within {budget:.1f}s")
+
+
+def generate(agent: str, prompt, cached_content=None, deadline: float = None, **kwargs):
+    """
+    GenerativeModel.generate_content for `agent`, with its model chain,
+    deadline and hedging applied. Blocking; call it off the event loop.
+
+    `deadline` (a time.monotonic() value) replaces the agent's own, so a
+    caller retrying differently can keep both calls within one budget.
+
+    With a vertexai CachedContent, the call goes to the cache's model only
+    (a cache belongs to one model) and has no fallback.
+    """
+    if deadline is None:
+        deadline = time.monotonic() + deadline_for(agent)
+    if cached_content is not None:
+        from vertexai.preview.generative_models import GenerativeModel
+        clients.get("vertexai")
+        model = GenerativeModel.from_cached_content(cached_content)
+        return _attempt(agent, lambda: model.generate_content(prompt, **kwargs), deadline - time.monotonic())
+
+    chain = models_for(agent)
+    for i, name in enumerate(chain):
+        last = i == len(chain) - 1
+        budget = deadline - time.monotonic()
+        if not last:
+            budget *= FALLBACK_SHARE
+        try:
+            return _attempt(agent, lambda name=name: _model(name).generate_content(prompt, **kwargs), budget)
+        except Exception as e:
+            if last:
+                raise
+            _count(agent, "fallbacks")
+            logger.warning("⤵️ %s: %s failed (%s); falling back to %s", agent, name, e, chain[i + 1])
+
+
+def generate_stream(agent: str, prompt, **kwargs):
+    """
+    Streaming generate_content for `agent`: yields the text of each chunk.
+    Falls back along the model chain only if nothing was yielded yet; the
+    deadline is checked between chunks. Blocking; iterate it off the loop.
+    """
+    chain = models_for(agent)
+    start = time.monotonic()
+    deadline = start + deadline_for(agent)
+    for i, name in enumerate(chain):
+        last = i == len(chain) - 1
+        started = False
+        try:
+            for chunk in _model(name).generate_content(prompt, stream=True, **kwargs):
+                if time.monotonic() > deadline:
+                    _count(agent, "timeouts")
+                    raise DeadlineExceeded(f"{agent}: stream did not finish within {deadline_for(agent):.1f}s")
+                started = True
+                yield chunk.text or ""
+            _record(agent, time.monotonic() - start)
+            return
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            if last or started:
+                _count(agent, "errors")
+                raise
+            _count(agent, "fallbacks")
+            logger.warning("⤵️ %s: %s failed (%s); falling back to %s", agent, name, e, chain[i + 1])
+
+
+# ─── ADK agents ──────────────────────────────────────────────────────────────
+
+_gemini = {}  # model name -> Gemini, each holding its own API client
+
+
+def _adk_gemini(name: str) -> Gemini:
+    llm = _gemini.get(name)
+    if llm is None:
+        llm = _gemini[name] = Gemini(model=name)
+    return llm
+
+
+async def _first(agen) -> LlmResponse:
+    try:
+        async for resp in agen:
+            return resp
+    finally:
+        await agen.aclose()
+
+
+class ManagedGemini(BaseLlm):
+    """
+    ADK model for an LlmAgent that applies the agent's model chain, deadline
+    and hedging. Streaming calls fall back only if nothing was streamed yet.
+    """
+
+    agent: str
+    fallbacks: List[str] = []
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        chain = [self.model, *self.fallbacks]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + deadline_for(self.agent)
+        for i, name in enumerate(chain):
+            last = i == len(chain) - 1
+            budget = deadline - loop.time()
+            if not last:
+                budget *= FALLBACK_SHARE
+            started = False
+            try:
+                if stream:
+                    async for resp in self._stream(name, llm_request, budget):
+                        started = True
+                        yield resp
+                else:
+                    yield await self._attempt(name, llm_request, budget)
+                return
+            except Exception as e:
+                if last or started:
+                    raise
+                _count(self.agent, "fallbacks")
+                logger.warning("⤵️ %s: %s failed (%s); falling back to %s", self.agent, name, e, chain[i + 1])
+
+    def _call(self, name: str, llm_request: LlmRequest, stream: bool):
+        # Gemini may append to contents, so each call gets its own request.
+        req = llm_request.model_copy(update={"model": name, "contents": list(llm_request.contents)})
+        return _adk_gemini(name).generate_content_async(req, stream=stream)
+
+    async def _attempt(self, name: str, llm_request: LlmRequest, budget: float) -> LlmResponse:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        end = start + budget
+        hedge_at = _hedge_delay(self.agent)
+        pending = {asyncio.ensure_future(_first(self._call(name, llm_request, False)))}
+        hedge = None
+        error = None
+        try:
+            while pending and loop.time() < end:
+                wake = end if hedge or hedge_at is None else min(end, start + hedge_at)
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, wake - loop.time()), return_when=asyncio.FIRST_COMPLETED
+                )
+                for t in done:
+                    if t.exception() is None:
+                        _record(self.agent, loop.time() - start)
+                        if t is hedge:
+                            _count(self.agent, "hedge_wins")
+                        return t.result()
+                    error = t.exception()
+                if pending and hedge is None and hedge_at is not None and loop.time() >= start + hedge_at:
+                    hedge = asyncio.ensure_future(_first(self._call(name, llm_request, False)))
+                    pending.add(hedge)
+                    _count(self.agent, "hedged")
+        finally:
+            for t in pending:
+                t.cancel()
+        if error is not None and not pending:
+            _count(self.agent, "errors")
+            raise error
+        _count(self.agent, "timeouts")
+        raise DeadlineExceeded(f"{self.agent}: no response within {budget:.1f}s")
+
+    async def _stream(self, name: str, llm_request: LlmRequest, budget: float):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        agen = self._call(name, llm_request, True)
+        try:
+            while True:
+                try:
+                    resp = await asyncio.wait_for(agen.__anext__(), timeout=max(0.0, start + budget - loop.time()))
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    _count(self.agent, "timeouts")
+                    raise DeadlineExceeded(f"{self.agent}: stream did not finish within {budget:.1f}s")
+                yield resp
+        except DeadlineExceeded:
+            raise
+        except Exception:
+            _count(self.agent, "errors")
+            raise
+        finally:
+            await agen.aclose()
+        _record(self.agent, loop.time() - start)
+
+
+def adk_model(agent: str) -> ManagedGemini:
+    """
+    The `model` for an LlmAgent, configured for `agent`.
+    """
+    chain = models_for(agent)
+    return ManagedGemini(model=chain[0], agent=agent, fallbacks=chain[1:])
@@ -7,12 +7,20 @@ import uvicorn
 load_dotenv()
 
 import os
+import time
+import asyncio
 import logging
 from logging.handlers import RotatingFileHandler
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers.agents import router as agents_router
+from app.routers.agents import router as agents_router, chat_history, calendar_jobs
+from app.concurrency import shutdown_executors
+from app import clients
+from app.agents.plantuml_renderer import shutdown_renderers
+from app.metrics import snapshot as metrics_snapshot
+from app.llm import DeadlineExceeded
 
 # ——— Logging setup —————————————————————————————————————————
 # You can override LOG_FILE_PATH in your .env if you like.
@@ -49,10 +57,52 @@ app.include_router(agents_router, prefix="/api/agents", tags=["agents"])
 app.include_router(agents_router, prefix="/api")
 
 
+@app.middleware("http")
+async def _server_timing(request: Request, call_next):
+    """
+    Server-Timing on every response: token verification (auth) and the
+    time until the response started (app), in ms.
+    """
+    t0 = time.perf_counter()
+    response = await call_next(request)
+    timings = [f"app;dur={(time.perf_counter() - t0) * 1e3:.1f}"]
+    auth_ms = getattr(request.state, "auth_ms", None)
+    if auth_ms is not None:
+        timings.insert(0, f"auth;dur={auth_ms:.1f}")
+    response.headers["Server-Timing"] = ", ".join(timings)
+    return response
+
+
+@app.on_event("startup")
+async def _warm_clients():
+    if clients.WARM == "blocking":
+        await clients.warm()
+    elif clients.WARM == "background":
+        app.state.warm_clients = asyncio.create_task(clients.warm())
+
+
+@app.on_event("shutdown")
+async def _shutdown_executors():
+    await calendar_jobs.drain()
+    await chat_history.drain()
+    shutdown_renderers()
+    shutdown_executors()
+
+
+@app.exception_handler(DeadlineExceeded)
+async def _deadline_exceeded(request: Request, exc: DeadlineExceeded):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
 
+
+@app.get("/metrics")
+def metrics():
+    return metrics_snapshot()
+
 if __name__== "__main__":
     port=int(os.environ.get("PORT", 8080))
     uvicorn.run(app, host="0.0.0.0", port=port,)
\ No newline at end of file
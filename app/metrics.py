@@ -0,0 +1,26 @@
+# app/metrics.py
+
+import logging
+
+logger = logging.getLogger("app.metrics")
+
+# name -> zero-arg callable returning a JSON-serialisable dict
+_providers = {}
+
+
+def register(name: str, provider) -> None:
+    """
+    Registers a provider whose output appears under `name` in GET /metrics.
+    """
+    _providers[name] = provider
+
+
+def snapshot() -> dict:
+    out = {}
+    for name, provider in _providers.items():
+        try:
+            out[name] = provider()
+        except Exception as e:
+            logger.warning("metrics provider %s failed: %s", name, e)
+            out[name] = {"error": str(e)}
+    return out
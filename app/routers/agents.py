@@ -1,34 +1,47 @@
 # app/routers/agents.py
 import io
-import os, uuid, json, re, tempfile, logging
+import os, uuid, json, re, base64, hashlib, logging, asyncio
+from datetime import timedelta
+from collections import Counter
+from contextlib import aclosing
 from json import JSONDecodeError
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import JSONResponse
-from fastapi.responses import FileResponse
-from google.adk.sessions import InMemorySessionService
-from google.adk.runners import Runner
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response
+from google.adk.agents.run_config import RunConfig, StreamingMode
 from google.genai import types as genai_types
 from fastapi import APIRouter, Depends, File, UploadFile, Form
 from google.cloud import firestore
-from pydantic import BaseModel
-from typing import Optional
+from google.api_core.exceptions import FailedPrecondition
+from pydantic import BaseModel, Field
+from typing import Optional, Literal
 from fastapi.responses import StreamingResponse
-from google.cloud import vision
 from app.agents.intent_parser import intent_agent
+from app.agents import intent_classifier
+from app.agents.runner_pool import RunnerPool, scratch_session, session_store
+from app.agents import response_cache
+from app.agents.chat_history import ChatHistory
+from app.agents.calendar_jobs import CalendarJobs
 from app.agents.ask_sahayak import (
     ask_explanation_seq, ask_story_seq, ask_quiz_seq,
     ask_lesson_seq, ask_game_seq, ask_reflect_seq, ask_chat_seq
 )
-from app.agents.diagram_generator import run_diagram_pipeline
-from app.agents.mindmap_generator import run_mindmap_pipeline
-from app.agents.worksheet_builder import run_worksheet_pipeline
+from app.agents.diagram_generator import run_diagram_variants, make_thumbnail
+from app.agents.mindmap_generator import run_mindmap_pipeline, fix_plantuml_code
+from app.agents.plantuml_renderer import render_plantuml, render_key, FORMATS as PLANTUML_FORMATS
+from app.agents.worksheet_builder import run_worksheet_pipeline, stream_worksheets, LEVELS, PARALLEL_LEVELS
+from app.agents.ocr import ocr_uploads
+from app.agents.worksheet_zip import stream_worksheets_zip
+from app.agents.autoeval_agent import grade_students, STUDENTS_PER_PROMPT
 from app.deps import get_current_user
+from app.concurrency import run_blocking, iterate_blocking
+from app.cache import TieredCache
+from app import clients, datastore
 from typing import List
 from app.deps import get_db, get_bucket
 from google.cloud import storage as gcs
 
 router = APIRouter()
-db = firestore.Client()
+db = clients.Lazy("firestore")
 logger = logging.getLogger("app.routers.agents")
 
 # ─────────────────────── ASK SAHAYAK ───────────────────────
@@ -47,27 +60,26 @@ AGENT_SEQS = {
     "chat":         ask_chat_seq,
 }
 
-@router.post("/ask-sahayak")
-async def ask_sahayak(req: AskPrompt, user=Depends(get_current_user)):
-    sid  = req.session_id or str(uuid.uuid4())
-    chat = db.collection("chat_sessions").document(sid)
-    msgs = chat.collection("messages")
-    msgs.add({"sender":"user","text":req.prompt,"ts":firestore.SERVER_TIMESTAMP})
-    chat.set({"last_updated":firestore.SERVER_TIMESTAMP}, merge=True)
+runners = RunnerPool({"intent": intent_agent, **AGENT_SEQS})
+
 
-    docs    = msgs.order_by("ts", direction=firestore.Query.DESCENDING).limit(10).stream()
-    history = [{"sender":d.get("sender"),"text":d.get("text")} for d in reversed(list(docs))]
-    logger.debug("🔍 Loaded history for %s: %s", sid, history)
+chat_history = ChatHistory(db)
+calendar_jobs = CalendarJobs(db)
 
-    sess1    = InMemorySessionService()
-    session1 = await sess1.create_session(app_name="ask-sahayak", user_id=user["uid"], state={"history":history})
-    runner1  = Runner(agent=intent_agent, app_name="ask-sahayak", session_service=sess1)
-    new_msg  = genai_types.Content(role="user", parts=[genai_types.Part(text=req.prompt)])
+
+async def _llm_intent(prompt: str, history: list, user: dict):
+    """
+    Runs intent_agent on the prompt and returns the raw (intent, slots) it parsed.
+    """
+    runner1  = runners.get("intent")
+    new_msg  = genai_types.Content(role="user", parts=[genai_types.Part(text=prompt)])
 
     intent_out = None
-    async for ev in runner1.run_async(user_id=user["uid"], session_id=session1.id, new_message=new_msg):
-        if ev.author == intent_agent.name and ev.content:
-            intent_out = "".join(p.text for p in ev.content.parts).strip()
+    # intent_agent reads nothing from state, so its throwaway session starts empty
+    async with scratch_session(user["uid"], {}) as session1:
+        async for ev in runner1.run_async(user_id=user["uid"], session_id=session1.id, new_message=new_msg):
+            if ev.author == intent_agent.name and ev.content:
+                intent_out = "".join(p.text for p in ev.content.parts).strip()
 
     logger.debug("🔍 Raw intent output: %r", intent_out or "")
     cleaned = re.sub(r"^```(?:json)?\s*", "", intent_out or "")
@@ -79,40 +91,183 @@ async def ask_sahayak(req: AskPrompt, user=Depends(get_current_user)):
     except JSONDecodeError:
         parsed = {}
 
-    intent = parsed.get("intent")
-    slots  = parsed.get("slots", {})
+    return parsed.get("intent"), parsed.get("slots", {})
+
+
+async def _resolve_intent(prompt: str, history: list, user: dict):
+    """
+    Resolves (intent, slots, path) for a prompt. `path` is "local" when the
+    in-process classifier was confident enough, otherwise "llm".
+    """
+    local = None
+    if intent_classifier.FASTPATH_MODE != "off":
+        local = intent_classifier.classify_intent(prompt, history)
+        logger.debug("🔍 Local intent: %s", local)
+
+    if (
+        intent_classifier.FASTPATH_MODE == "on"
+        and local["confidence"] >= intent_classifier.MIN_CONFIDENCE
+    ):
+        intent, slots, path = local["intent"], dict(local["slots"]), "local"
+    else:
+        intent, slots = await _llm_intent(prompt, history, user)
+        path = "llm"
+        if intent_classifier.FASTPATH_MODE == "shadow":
+            intent_classifier.record_shadow(local, intent)
+    logger.info("🧭 intent=%s via %s", intent, path)
 
     if not intent:
         intent = "chat" if history else "explanation"
         if not history:
-            slots = {"topic": req.prompt, "grades": [], "language": ""}
+            slots = {"topic": prompt, "grades": [], "language": ""}
 
     if intent in ("story", "quiz", "lesson_plan", "game") and not slots.get("topic"):
-        slots["topic"] = req.prompt
+        slots["topic"] = prompt
     if intent == "reflect":
-        slots["reflection"] = req.prompt
+        slots["reflection"] = prompt
 
-    seq = AGENT_SEQS.get(intent)
-    if not seq:
+    if intent not in AGENT_SEQS:
         raise HTTPException(400, f"Unknown intent: {intent}")
+    return intent, slots, path
+
+
+async def _start_seq(sid: str, intent: str, slots: dict, history: list, user: dict):
+    """
+    Returns (runner, session) for the agent sequence of `intent`, reusing the
+    pooled runner and the live ADK session of `sid`.
+    """
+    state = {**slots, "history_summary": chat_history.summary(sid)}
+    session2 = await session_store.acquire(user["uid"], sid, history, state, chat_history.seq(sid))
+    return runners.get(intent), session2
+
+
+def _queue_calendar(intent: str, sid: str, slots: dict, lesson_text: str, user: dict) -> Optional[str]:
+    """
+    Lesson plans get their Drive attachment and Calendar event in the
+    background; returns the job id to poll, or None for other intents.
+    """
+    if intent != "lesson_plan" or not lesson_text:
+        return None
+    return calendar_jobs.enqueue(user["uid"], sid, slots, lesson_text)
 
-    state    = {"history": history, **slots}
-    sess2    = InMemorySessionService()
-    session2 = await sess2.create_session(app_name="ask-sahayak", user_id=user["uid"], state=state)
-    runner2  = Runner(agent=seq, app_name="ask-sahayak", session_service=sess2)
 
-    reply = ""
-    async for ev in runner2.run_async(user_id=user["uid"], session_id=session2.id, new_message=new_msg):
-        if ev.content:
-            chunk = "".join(p.text or "" for p in ev.content.parts)
-            reply += chunk
-            logger.debug("🔸 chunk from %s: %r", ev.author, chunk)
+@router.get("/ask-sahayak/jobs/{job_id}")
+async def calendar_job_status(job_id: str, user=Depends(get_current_user)):
+    """
+    Status of a lesson plan's calendar job:
+      { id, status: queued|running|done|failed, result?, error? }
+    `result` is manage_lesson_event's {status, message, attachment_url}.
+    """
+    job = await calendar_jobs.status(job_id)
+    if job is None or job.pop("uid", None) != user["uid"]:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.post("/ask-sahayak")
+async def ask_sahayak(req: AskPrompt, user=Depends(get_current_user)):
+    sid = req.session_id or str(uuid.uuid4())
+    history = await chat_history.open_turn(sid, req.prompt)
+    intent, slots, path = await _resolve_intent(req.prompt, history, user)
+
+    reply, cache_kind = await run_blocking("response_cache", response_cache.lookup, intent, slots, req.prompt)
+    if reply is None:
+        runner2, session2 = await _start_seq(sid, intent, slots, history, user)
+        new_msg = genai_types.Content(role="user", parts=[genai_types.Part(text=req.prompt)])
+
+        reply = ""
+        async for ev in runner2.run_async(user_id=user["uid"], session_id=session2.id, new_message=new_msg):
+            if ev.content:
+                chunk = "".join(p.text or "" for p in ev.content.parts)
+                reply += chunk
+                logger.debug("🔸 chunk from %s: %r", ev.author, chunk)
+
+        reply = reply.strip()
+        await run_blocking("response_cache", response_cache.store, intent, slots, req.prompt, reply)
+    logger.debug("✅ final reply (%s): %r", cache_kind, reply)
 
-    reply = reply.strip()
-    logger.debug("✅ final reply: %r", reply)
+    chat_history.close_turn(sid, reply)
+    return {
+        "session_id": sid, "response": reply,
+        "intent": intent, "intent_path": path, "cache": cache_kind,
+        "calendar_job": _queue_calendar(intent, sid, slots, reply, user),
+    }
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/ask-sahayak/stream")
+async def ask_sahayak_stream(req: AskPrompt, user=Depends(get_current_user)):
+    """
+    Streaming variant of /ask-sahayak as Server-Sent Events:
+      event: intent  → {session_id, intent, intent_path, cache}  (as soon as the intent is resolved)
+      event: chunk   → {author, text}          (partial model output)
+      event: done    → {session_id, response, calendar_job}  (full reply)
+      event: error   → {detail}
+    """
+    sid = req.session_id or str(uuid.uuid4())
+    history = await chat_history.open_turn(sid, req.prompt)
+    intent, slots, path = await _resolve_intent(req.prompt, history, user)
+    cached, cache_kind = await run_blocking("response_cache", response_cache.lookup, intent, slots, req.prompt)
+    new_msg = genai_types.Content(role="user", parts=[genai_types.Part(text=req.prompt)])
+    run_cfg = RunConfig(streaming_mode=StreamingMode.SSE)
+
+    async def events():
+        yield _sse("intent", {
+            "session_id": sid, "intent": intent, "intent_path": path, "cache": cache_kind,
+        })
+
+        if cached is not None:
+            yield _sse("chunk", {"author": "cache", "text": cached})
+            chat_history.close_turn(sid, cached)
+            yield _sse("done", {
+                "session_id": sid, "response": cached,
+                "calendar_job": _queue_calendar(intent, sid, slots, cached, user),
+            })
+            return
+
+        runner2, session2 = await _start_seq(sid, intent, slots, history, user)
+        parts = []
+        streamed = set()  # authors whose current turn already arrived as partials
+        try:
+            async for ev in runner2.run_async(
+                user_id=user["uid"], session_id=session2.id,
+                new_message=new_msg, run_config=run_cfg,
+            ):
+                if not ev.content or not ev.content.parts:
+                    continue
+                chunk = "".join(p.text or "" for p in ev.content.parts)
+                if ev.partial:
+                    streamed.add(ev.author)
+                elif ev.author in streamed:
+                    # final aggregate of text we already forwarded
+                    streamed.discard(ev.author)
+                    continue
+                if not chunk:
+                    continue
+                parts.append(chunk)
+                yield _sse("chunk", {"author": ev.author, "text": chunk})
+        except Exception as e:
+            logger.exception("❌ ask-sahayak stream failed for %s", sid)
+            yield _sse("error", {"detail": str(e)})
+            return
+
+        reply = "".join(parts).strip()
+        logger.debug("✅ final streamed reply: %r", reply)
+        await run_blocking("response_cache", response_cache.store, intent, slots, req.prompt, reply)
+        chat_history.close_turn(sid, reply)
+        yield _sse("done", {
+            "session_id": sid, "response": reply,
+            "calendar_job": _queue_calendar(intent, sid, slots, reply, user),
+        })
 
-    msgs.add({"sender":"bot","text":reply,"ts":firestore.SERVER_TIMESTAMP})
-    return {"session_id": sid, "response": reply}
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 # ─────────────────────── DIAGRAM GENERATOR (Image) ───────────────────────
@@ -121,25 +276,83 @@ class DiagramRequest(BaseModel):
     prompt: str
     diagram_type: str
     grade: int
+    subject: Optional[str] = None
+    regenerate: int = Field(1, ge=1, le=5, description="Number of variants to generate (1–5)")
+    thumbnails: bool = Field(False, description="Include downscaled JPEG previews of each variant")
+
+# PNGs of recent diagram requests, bounded by total bytes.
+# Memory only: a repeat request costs neither an Imagen call nor disk I/O.
+DIAGRAM_CACHE_TTL = int(os.getenv("DIAGRAM_CACHE_TTL_SECONDS", "86400"))
+_diagram_cache = TieredCache(
+    "diagram",
+    memory_size=int(os.getenv("DIAGRAM_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+    ttl=DIAGRAM_CACHE_TTL,
+    getsizeof=lambda entry: sum(len(v["png"]) + len(v.get("thumb") or b"") for v in entry["variants"]),
+)
+
+
+def _etag(data: bytes) -> str:
+    return f'"{hashlib.sha256(data).hexdigest()[:32]}"'
+
+
+def _with_thumbnails(entry: dict) -> dict:
+    """
+    A copy of the cache entry with a thumbnail for every variant. A copy, so
+    the caller re-inserts it and the cache counts the thumbnail bytes.
+    """
+    return {"variants": [
+        v if "thumb" in v else {**v, "thumb": make_thumbnail(v["png"])} for v in entry["variants"]
+    ]}
+
 
 @router.post("/diagram-generator")
-async def generate_diagram(req: DiagramRequest, user=Depends(get_current_user)):
-    img_bytes = run_diagram_pipeline(
-        prompt=req.prompt,
-        diagram_type=req.diagram_type,
-        grade=req.grade
-    )
-    tmp_dir = tempfile.gettempdir()
-    filename = f"{req.diagram_type}_{uuid.uuid4().hex}.png"
-    tmp_path = os.path.join(tmp_dir, filename)
-    with open(tmp_path, "wb") as f:
-        f.write(img_bytes)
-
-    return FileResponse(
-        path=tmp_path,
-        media_type="image/png",
-        filename=filename
-    )
+async def generate_diagram(req: DiagramRequest, request: Request, user=Depends(get_current_user)):
+    """
+    regenerate == 1 → the PNG itself.
+    regenerate  > 1 → JSON with every variant as base64, generated in one
+                      Imagen request, plus base64 JPEG thumbnails if asked:
+      { "variants": [ { "index", "etag", "image", "thumbnail"? }, … ] }
+    """
+    key = hashlib.sha256(json.dumps(
+        [req.prompt.strip(), req.diagram_type, req.grade, req.subject or "", req.regenerate]
+    ).encode("utf-8")).hexdigest()
+
+    entry = _diagram_cache.get(key)
+    if entry is None:
+        images = await run_blocking(
+            "imagen", run_diagram_variants,
+            prompt=req.prompt,
+            diagram_type=req.diagram_type,
+            grade=req.grade,
+            subject=req.subject,
+            count=req.regenerate
+        )
+        entry = {"variants": [{"png": b, "etag": _etag(b)} for b in images]}
+        _diagram_cache.set(key, entry)
+
+    if req.regenerate == 1:
+        variant = entry["variants"][0]
+        etag = variant["etag"]
+    else:
+        etag = _etag("".join(v["etag"] for v in entry["variants"]).encode() + (b"t" if req.thumbnails else b""))
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={DIAGRAM_CACHE_TTL}"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    if req.regenerate == 1:
+        headers["Content-Disposition"] = f'attachment; filename="{req.diagram_type}_{key[:16]}.png"'
+        return Response(content=variant["png"], media_type="image/png", headers=headers)
+
+    if req.thumbnails and any("thumb" not in v for v in entry["variants"]):
+        entry = await run_blocking("thumbnails", _with_thumbnails, entry)
+        _diagram_cache.set(key, entry)
+    variants = []
+    for i, v in enumerate(entry["variants"]):
+        item = {"index": i, "etag": v["etag"], "image": base64.b64encode(v["png"]).decode("ascii")}
+        if req.thumbnails and v.get("thumb"):
+            item["thumbnail"] = base64.b64encode(v["thumb"]).decode("ascii")
+        variants.append(item)
+    return JSONResponse({"variants": variants}, headers=headers)
 
 
 # ─────────────────────── MIND MAP GENERATOR (PlantUML Code) ───────────────────────
@@ -148,6 +361,20 @@ class MindmapRequest(BaseModel):
     text: str
     grade: int
     subject: str
+    render: Optional[Literal["svg", "png"]] = None
+
+
+class MindmapRenderRequest(BaseModel):
+    code: str
+    format: Literal["svg", "png"] = "svg"
+
+
+async def _render_mindmap(code: str, fmt: str) -> bytes:
+    try:
+        return await run_blocking("plantuml", render_plantuml, code, fmt)
+    except (RuntimeError, TimeoutError) as e:
+        logger.error("❌ PlantUML render failed: %s", e)
+        raise HTTPException(503, f"Mind map rendering unavailable: {e}")
 
 
 @router.post("/mindmap-generator")
@@ -155,55 +382,149 @@ async def generate_mindmap(req: MindmapRequest, user=Depends(get_current_user)):
     """
     Returns cleaned PlantUML code as a JSON response.
     JSON will escape newlines (\n) but the code is valid and will render fine.
+    With `render`, the map is also rendered on the server:
+      { "code", "format", "image" }  (SVG text, or base64 PNG)
     """
-    result = run_mindmap_pipeline(
+    result = await run_blocking(
+        "gemini", run_mindmap_pipeline,
         text=req.text,
         grade=req.grade,
         subject=req.subject
     )
-    return { "code": result["code"] }  # stays JSON with valid PlantUML inside
+    if not req.render:
+        return { "code": result["code"] }  # stays JSON with valid PlantUML inside
+
+    image = await _render_mindmap(result["code"], req.render)
+    return {
+        "code": result["code"],
+        "format": req.render,
+        "image": image.decode("utf-8") if req.render == "svg" else base64.b64encode(image).decode("ascii"),
+    }
+
+
+@router.post("/mindmap-generator/render")
+async def render_mindmap(req: MindmapRenderRequest, request: Request, user=Depends(get_current_user)):
+    """
+    Renders PlantUML code (as returned by /mindmap-generator) to an SVG/PNG
+    image. Repeat views are served from the render cache or answered with 304.
+    """
+    code = fix_plantuml_code(req.code)
+    etag = f'"{render_key(code, req.format)[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=86400"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    image = await _render_mindmap(code, req.format)
+    return Response(content=image, media_type=PLANTUML_FORMATS[req.format], headers=headers)
 #-------------------------------------------------------------------------------
-# inline Vision OCR
-_vision = vision.ImageAnnotatorClient()
-def ocr_image_to_text(b: bytes) -> str:
-    img = vision.Image(content=b)
-    res = _vision.text_detection(image=img)
-    if res.error.message:
-        raise RuntimeError(res.error.message)
-    return (res.full_text_annotation.text or "").strip()
 
 @router.post("/worksheets/json")
 async def worksheets_json(
     grade: int = Form(...),
     subject: str = Form(...),
     num_questions: int = Form(5),
+    parallel: Optional[bool] = Form(None),
     files: List[UploadFile] = File(...),
     user = Depends(get_current_user)
 ):
-    # 1) OCR
-    pages = []
-    for f in files:
-        b = await f.read()
-        pages.append(ocr_image_to_text(b))
+    """
+    Returns { "worksheets": [ {level, questions, answers}, … ], "missing"? }.
+    `parallel` generates the levels as concurrent calls (default:
+    WORKSHEET_PARALLEL); a partial result lists the failed levels in
+    "missing".
+    """
+    # 1) OCR (concurrent, page order preserved)
+    pages = await ocr_uploads(files, perceptual=True)
 
     # 2) Gemini → JSON
-    result = run_worksheet_pipeline(
+    result = await run_blocking(
+        "gemini", run_worksheet_pipeline,
         pages=pages,
         grade=grade,
         subject=subject,
-        num_questions=num_questions
+        num_questions=num_questions,
+        parallel=PARALLEL_LEVELS if parallel is None else parallel,
     )
     # result is already a dict: { "worksheets": [ {level,questions,answers}, … ] }
     return JSONResponse(result)
 
+
+@router.post("/worksheets/stream")
+async def worksheets_stream(
+    grade: int = Form(...),
+    subject: str = Form(...),
+    num_questions: int = Form(5),
+    parallel: Optional[bool] = Form(None),
+    files: List[UploadFile] = File(...),
+    user = Depends(get_current_user)
+):
+    """
+    Same input as /worksheets/json, as Server-Sent Events:
+      event: worksheet → {level, questions, answers}  (as soon as each level is complete)
+      event: done      → {count, missing}
+      event: error     → {detail}
+    """
+    pages = await ocr_uploads(files, perceptual=True)
+
+    async def events():
+        levels = []
+        items = iterate_blocking(
+            "gemini", stream_worksheets,
+            pages=pages, grade=grade, subject=subject, num_questions=num_questions,
+            parallel=PARALLEL_LEVELS if parallel is None else parallel,
+        )
+        try:
+            # aclosing: a client that disconnects stops the Gemini stream too
+            async with aclosing(items):
+                async for ws in items:
+                    levels.append(ws.get("level"))
+                    yield _sse("worksheet", ws)
+        except Exception as e:
+            logger.exception("❌ worksheet stream failed")
+            yield _sse("error", {"detail": str(e)})
+            return
+        yield _sse("done", {"count": len(levels), "missing": [l for l in LEVELS if l not in levels]})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+class WorksheetZipRequest(BaseModel):
+    grade: int
+    subject: str
+    worksheets: List[dict] = Field(..., min_length=1, description="As returned by /worksheets/json")
+
+
+@router.post("/worksheets/zip")
+async def worksheets_zip(req: WorksheetZipRequest, user=Depends(get_current_user)):
+    """
+    Streams a ZIP with a questions PDF and an answers PDF per worksheet.
+    PDFs render in the process pool and are cached by their worksheet JSON.
+    """
+    filename = f"{req.subject}_Grade{req.grade}_worksheets.zip"
+    return StreamingResponse(
+        stream_worksheets_zip(req.worksheets, req.grade, req.subject),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
     #----------------------------------------------------------------------
     
+# Files uploaded in parallel per publish, and the resumable upload chunk size
+# (GCS requires a multiple of 256 KiB).
+UPLOAD_CONCURRENCY = int(os.getenv("RESOURCE_UPLOAD_CONCURRENCY", "4"))
+UPLOAD_CHUNK_BYTES = int(os.getenv("RESOURCE_UPLOAD_CHUNK_MB", "8")) * 1024 * 1024
+
+
 @router.post("/resources")
 async def publish_resource(
     title: str = Form(...),
     type: str = Form(...),                  # "worksheet" or "diagram"
     payload: str = Form(...),               # JSON string describing the resource
     files: List[UploadFile] = File(...),    # PDFs or images
+    tags: str = Form(""),                   # comma-separated, for filtering the bazaar
     db: firestore.Client = Depends(get_db),
     bucket: gcs.Bucket = Depends(get_bucket),
     user=Depends(get_current_user),
@@ -217,36 +538,137 @@ async def publish_resource(
     resource_id = str(uuid.uuid4())
     now = firestore.SERVER_TIMESTAMP
 
-    # 2) Upload files & collect metadata
-    file_entries = []
-    for f in files:
+    # 2) Upload files concurrently & collect metadata
+    slots = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+    async def upload(f: UploadFile) -> dict:
         path = f"{resource_id}/{f.filename}"
-        blob = bucket.blob(path)
-        content = await f.read()
-        blob.upload_from_string(content)
-        file_entries.append({"filename": f.filename, "path": path})
-
-    # 3) Persist to Firestore
-    doc_ref = db.collection("resources").document(resource_id)
-    doc_ref.set({
-        "title": title,
-        "type": type,
-        "payload": payload,
-        "files": file_entries,
-        "created_by": user["uid"],
-        "created_at": now,
-    })
+        async with slots:
+            await run_blocking("gcs", _upload_blob, bucket, path, f)
+        return {"filename": f.filename, "path": path}
+
+    results = await asyncio.gather(*(upload(f) for f in files), return_exceptions=True)
+    file_entries = [r for r in results if isinstance(r, dict)]
+    failed = next((r for r in results if isinstance(r, BaseException)), None)
+    if failed is not None:
+        await _delete_blobs(bucket, [e["path"] for e in file_entries])
+        raise failed
+
+    # 3) Persist to Firestore, only once every blob has landed
+    try:
+        await run_blocking("firestore", datastore.create_resource, db, resource_id, {
+            "title": title,
+            "type": type,
+            "payload": payload,
+            "files": file_entries,
+            "tags": [t.strip().lower() for t in tags.split(",") if t.strip()],
+            "created_by": user["uid"],
+            "created_at": now,
+        })
+    except Exception:
+        await _delete_blobs(bucket, [e["path"] for e in file_entries])
+        raise
 
     return {"id": resource_id, "title": title, "type": type}
 
 
+def _upload_blob(bucket: gcs.Bucket, path: str, f: UploadFile) -> None:
+    """
+    Streams an upload to GCS straight from its spooled temp file. Files above
+    one chunk go through a resumable upload, sent UPLOAD_CHUNK_BYTES at a time.
+    """
+    f.file.seek(0, os.SEEK_END)
+    size = f.file.tell()
+    blob = bucket.blob(path, chunk_size=UPLOAD_CHUNK_BYTES if size > UPLOAD_CHUNK_BYTES else None)
+    blob.upload_from_file(f.file, rewind=True, size=size, content_type=f.content_type)
+
+
+async def _delete_blobs(bucket: gcs.Bucket, paths: list) -> None:
+    for path in paths:
+        try:
+            await run_blocking("gcs", bucket.blob(path).delete)
+        except Exception as e:
+            logger.warning("Could not remove orphaned upload %s: %s", path, e)
+
+
+# Signed URLs are valid for SIGNED_URL_TTL seconds and reused from the cache
+# until SIGNED_URL_REFRESH_MARGIN seconds before they expire.
+SIGNED_URL_TTL = 3600
+SIGNED_URL_REFRESH_MARGIN = int(os.getenv("SIGNED_URL_REFRESH_MARGIN_SECONDS", "300"))
+_signed_urls = TieredCache(
+    "signed_url",
+    memory_size=int(os.getenv("SIGNED_URL_CACHE_ENTRIES", "20000")),
+    ttl=SIGNED_URL_TTL - SIGNED_URL_REFRESH_MARGIN,
+)
+
+RESOURCE_LIST_FIELDS = ["title", "type", "files"]
+RESOURCE_OPTIONAL_FIELDS = {"payload", "tags", "created_by", "created_at"}
+
+
+def _signed_url(bucket: gcs.Bucket, path: str) -> str:
+    url = _signed_urls.get(path)
+    if url is None:
+        url = bucket.blob(path).generate_signed_url(expiration=timedelta(seconds=SIGNED_URL_TTL))
+        _signed_urls.set(path, url)
+    return url
+
+
+def _sign_files(bucket: gcs.Bucket, files: list) -> list:
+    return [{"filename": f["filename"], "url": _signed_url(bucket, f["path"])} for f in files]
+
+
+def _list_resources(
+    db: firestore.Client,
+    bucket: gcs.Bucket,
+    limit: Optional[int],
+    cursor: Optional[str],
+    type: Optional[str],
+    tag: Optional[str],
+    extra_fields: list,
+):
+    """
+    One page of resources, newest first, with signed file URLs. Returns
+    (items, next_cursor).
+    """
+    try:
+        docs, next_cursor = datastore.list_resources(
+            db, limit, cursor, type, tag, RESOURCE_LIST_FIELDS + extra_fields
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FailedPrecondition as e:
+        # a composite index from firestore.indexes.json is missing or still building
+        logger.error("❌ resource listing needs a Firestore index: %s", e)
+        raise HTTPException(status_code=503, detail="Filtered resource listing is not available yet; its index is missing or building")
+
+    out = []
+    for doc_id, data in docs:
+        item = {
+            "id": doc_id,
+            "title": data.get("title"),
+            "type": data.get("type"),
+            "files": _sign_files(bucket, data.get("files", [])),
+        }
+        for field in extra_fields:
+            item[field] = data.get(field)
+        out.append(item)
+
+    return out, next_cursor
+
+
 @router.get("/resources")
 async def list_resources(
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    cursor: Optional[str] = None,
+    type: Optional[str] = None,
+    tag: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated extra fields: payload, tags, created_by, created_at"),
     db: firestore.Client = Depends(get_db),
     bucket: gcs.Bucket = Depends(get_bucket),
 ):
     """
-    Lists all resources. Returns:
+    Lists resources newest first; all of them unless `limit` is given, in
+    which case a page at a time. Returns:
     [
       {
         id: "...",
@@ -256,25 +678,19 @@ async def list_resources(
       },
       ...
     ]
+    With `limit`, when more pages exist, the X-Next-Cursor header holds the
+    `cursor` for the next call.
     """
-    docs = db.collection("resources").stream()
-    out = []
+    extra = [f.strip() for f in (fields or "").split(",") if f.strip()]
+    unknown = set(extra) - RESOURCE_OPTIONAL_FIELDS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
 
-    for doc in docs:
-        data = doc.to_dict()
-        signed = []
-        for f in data.get("files", []):
-            url = bucket.blob(f["path"]).generate_signed_url(expiration=3600)
-            signed.append({"filename": f["filename"], "url": url})
-
-        out.append({
-            "id": doc.id,
-            "title": data.get("title"),
-            "type": data.get("type"),
-            "files": signed,
-        })
-
-    return JSONResponse(out)
+    out, next_cursor = await run_blocking(
+        "firestore", _list_resources, db, bucket, limit, cursor, type, tag, extra
+    )
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    return JSONResponse(out, headers=headers)
 
 
 @router.get("/resources/{resource_id}")
@@ -286,15 +702,11 @@ async def get_resource(
     """
     Fetches a single resource by ID, including its payload and signed file URLs.
     """
-    doc = db.collection("resources").document(resource_id).get()
-    if not doc.exists:
+    data = await run_blocking("firestore", datastore.get_resource, db, resource_id)
+    if data is None:
         raise HTTPException(status_code=404, detail="Resource not found")
 
-    data = doc.to_dict()
-    signed = []
-    for f in data.get("files", []):
-        url = bucket.blob(f["path"]).generate_signed_url(expiration=3600)
-        signed.append({"filename": f["filename"], "url": url})
+    signed = await run_blocking("gcs", _sign_files, bucket, data.get("files", []))
 
     return JSONResponse({
         "id": resource_id,
@@ -303,3 +715,169 @@ async def get_resource(
         "payload": data.get("payload"),
         "files": signed,
     })
+
+
+# ─────────────────────────────── AUTOEVAL ───────────────────────────────
+
+AUTOEVAL_CONCURRENCY = int(os.getenv("AUTOEVAL_CONCURRENCY", "4"))
+
+
+def _answer_key(db: firestore.Client, resource_id: str, level: str) -> List[str]:
+    data = datastore.get_resource(db, resource_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Resource not found")
+    payload = data.get("payload") or "{}"
+    try:
+        if isinstance(payload, str):
+            payload = json.loads(payload)
+        worksheets = payload.get("worksheets", [])
+    except (JSONDecodeError, AttributeError):
+        logger.error("❌ resource %s has a malformed payload", resource_id)
+        raise HTTPException(status_code=422, detail="Resource payload is not a valid worksheet")
+    for ws in worksheets:
+        if ws.get("level") == level:
+            return ws.get("answers", [])
+    raise HTTPException(status_code=404, detail=f"Level {level!r} not found in resource")
+
+
+def _parse_answers(correct_answers: str) -> List[str]:
+    """
+    The `correct_answers` form field: a JSON list of answers in question order.
+    """
+    try:
+        key = json.loads(correct_answers)
+    except JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid correct_answers: {e}")
+    if not isinstance(key, list) or not key:
+        raise HTTPException(status_code=400, detail="correct_answers must be a non-empty JSON list")
+    return [str(a) for a in key]
+
+
+def _group_sheets(files: List[UploadFile], students: Optional[str]) -> list:
+    """
+    Splits the uploads into [(student_id, [files])]. `students` is a JSON
+    list of {"id", "pages"} in upload order, with unique ids; without it
+    every file is one student, named after the file ("scan", "scan-2", …
+    when names repeat).
+    """
+    if not students:
+        groups, taken = [], set()
+        for f in files:
+            stem = sid = os.path.splitext(f.filename or "")[0] or "student"
+            n = 1
+            while sid in taken:
+                n += 1
+                sid = f"{stem}-{n}"
+            taken.add(sid)
+            groups.append((sid, [f]))
+        return groups
+    try:
+        spec = json.loads(students)
+        counts = [int(s["pages"]) for s in spec]
+    except (ValueError, TypeError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid students: {e}")
+    if sum(counts) != len(files) or min(counts, default=1) < 1:
+        raise HTTPException(status_code=400, detail="students pages must add up to the number of files")
+    groups, i = [], 0
+    for s, n in zip(spec, counts):
+        groups.append((str(s.get("id") or len(groups) + 1), files[i:i + n]))
+        i += n
+    dupes = sorted(sid for sid, c in Counter(sid for sid, _ in groups).items() if c > 1)
+    if dupes:
+        raise HTTPException(status_code=400, detail=f"Duplicate student ids: {', '.join(dupes)}")
+    return groups
+
+
+@router.post("/autoeval")
+async def autoeval(
+    resource_id: str = Form(...),
+    level: str = Form(...),
+    files: List[UploadFile] = File(...),
+    db: firestore.Client = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    """
+    Grades one student's answer sheet (all `files`) against the answers of
+    `level` in a published worksheet resource. Returns {score, details}.
+    """
+    key = await run_blocking("firestore", _answer_key, db, resource_id, level)
+    text = "\n".join(await ocr_uploads(files))
+    result = (await run_blocking("gemini", grade_students, key, [("student", text)]))[0]
+    return {"score": result["score"], "details": result["details"]}
+
+
+@router.post("/autoeval/batch")
+async def autoeval_batch(
+    resource_id: Optional[str] = Form(None),
+    level: Optional[str] = Form(None),
+    files: List[UploadFile] = File(...),
+    students: Optional[str] = Form(None),
+    correct_answers: Optional[str] = Form(None),
+    db: firestore.Client = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    """
+    Grades a whole class against `correct_answers` (a JSON list in question
+    order), or else the answers of `level` in the published resource
+    `resource_id`. Students are OCR'd concurrently, then graded
+    STUDENTS_PER_PROMPT to a model call, sharing the answer key. Results
+    stream as Server-Sent Events as each group finishes:
+      event: result → {student, score, details}
+      event: error  → {student, detail}
+      event: done   → {graded, failed}
+    """
+    if correct_answers is not None:
+        key = _parse_answers(correct_answers)
+    elif resource_id and level:
+        key = await run_blocking("firestore", _answer_key, db, resource_id, level)
+    else:
+        raise HTTPException(status_code=400, detail="Give correct_answers, or resource_id and level")
+    groups = _group_sheets(files, students)
+    packs = [groups[i:i + STUDENTS_PER_PROMPT] for i in range(0, len(groups), STUDENTS_PER_PROMPT)]
+    slots = asyncio.Semaphore(AUTOEVAL_CONCURRENCY)
+
+    # The uploads are closed once this handler returns, before the response
+    # body runs, so every sheet is OCR'd here; only the grading streams.
+    async def read(pack: list):
+        async with slots:
+            try:
+                pages = await ocr_uploads([f for _, sheet in pack for f in sheet])
+            except Exception as e:
+                logger.exception("❌ autoeval batch OCR failed")
+                return pack, None, str(e)
+        texts, i = [], 0
+        for sid, sheet in pack:
+            texts.append((sid, "\n".join(pages[i:i + len(sheet)])))
+            i += len(sheet)
+        return pack, texts, None
+
+    read_packs = await asyncio.gather(*(read(p) for p in packs))
+
+    async def grade(pack: list, texts: Optional[list], error: Optional[str]):
+        if error is not None:
+            return [{"student": sid} for sid, _ in pack], error
+        async with slots:
+            try:
+                return await run_blocking("gemini", grade_students, key, texts), None
+            except Exception as e:
+                logger.exception("❌ autoeval batch group failed")
+                return [{"student": sid} for sid, _ in pack], str(e)
+
+    async def events():
+        graded = failed = 0
+        for next_done in asyncio.as_completed([grade(*r) for r in read_packs]):
+            results, error = await next_done
+            for r in results:
+                if error is None:
+                    graded += 1
+                    yield _sse("result", r)
+                else:
+                    failed += 1
+                    yield _sse("error", {"student": r["student"], "detail": error})
+        yield _sse("done", {"graded": graded, "failed": failed})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,79 @@
+# scripts/bench_calendar_clients.py
+"""
+Benchmark for the Google API clients used by manage_lesson_event.
+
+  before: build("drive") + build("calendar") on every call, each with a
+          fresh HTTP connection
+  after : calendar_tool.services(), built once per thread and reused
+
+By default only client setup is timed, which needs no network. With
+--live, each iteration also lists one event from CALENDAR_ID (default
+"primary"), so the numbers include the TLS handshake a fresh client pays
+and a reused one does not.
+
+Needs GOOGLE_APPLICATION_CREDENTIALS, as the app does.
+
+Usage:
+  python -m scripts.bench_calendar_clients [--live] [iterations]
+"""
+
+import os
+import sys
+import time
+import statistics
+
+from googleapiclient.discovery import build
+
+from app import clients
+from app.agents import calendar_tool
+
+
+def before():
+    creds = clients.get("calendar_credentials")
+    drive = build("drive", "v3", credentials=creds)
+    cal = build("calendar", "v3", credentials=creds)
+    return drive, cal
+
+
+def after():
+    return calendar_tool.services()
+
+
+def call(factory, live: bool) -> None:
+    drive, cal = factory()
+    if live:
+        cal.events().list(
+            calendarId=os.environ.get("CALENDAR_ID", "primary"), maxResults=1
+        ).execute()
+
+
+def report(name: str, samples: list) -> None:
+    samples = sorted(samples)
+    p95 = samples[max(0, int(len(samples) * 0.95) - 1)]
+    print(f"{name:<7} mean={statistics.mean(samples):9.2f}ms  p50={statistics.median(samples):9.2f}ms  p95={p95:9.2f}ms")
+
+
+def measure(factory, n: int, live: bool) -> list:
+    out = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        call(factory, live)
+        out.append((time.perf_counter() - t0) * 1e3)
+    return out
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    live = "--live" in args
+    args = [a for a in args if a != "--live"]
+    n = int(args[0]) if args else (20 if live else 200)
+
+    t0 = time.perf_counter()
+    calendar_tool.services()
+    print(f"first services() on this thread (one-off): {(time.perf_counter() - t0) * 1e3:.1f}ms")
+    report("before", measure(before, n, live))
+    report("after", measure(after, n, live))
+
+
+if __name__ == "__main__":
+    main()
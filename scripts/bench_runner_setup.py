@@ -0,0 +1,76 @@
+# scripts/bench_runner_setup.py
+"""
+Micro-benchmark for the per-request ADK setup done by /ask-sahayak,
+excluding any model call.
+
+  before: 2 × (InMemorySessionService + create_session + Runner) per request
+  after : pooled runners + scratch intent session + SessionStore.acquire
+
+Usage:
+  python -m scripts.bench_runner_setup [iterations]
+"""
+
+import sys
+import time
+import asyncio
+import statistics
+
+from google.adk.agents import LlmAgent, SequentialAgent
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+
+from app.agents.runner_pool import RunnerPool, scratch_session, session_store
+
+# Stand-ins with the same shape as the real agents; they are never run.
+intent = LlmAgent(name="bench_intent", model="gemini-2.5-pro", instruction="x")
+seq = SequentialAgent(
+    name="bench_seq",
+    sub_agents=[LlmAgent(name="bench_explain", model="gemini-2.5-pro", instruction="x")],
+)
+HISTORY = [{"sender": "user" if i % 2 else "bot", "text": "lorem ipsum " * 40} for i in range(10)]
+SLOTS = {"topic": "photosynthesis", "grades": [5], "language": "Hindi", "date": "2025-01-01"}
+
+
+async def before(i: int) -> None:
+    sess1 = InMemorySessionService()
+    s1 = await sess1.create_session(app_name="ask-sahayak", user_id="u", state={"history": HISTORY})
+    Runner(agent=intent, app_name="ask-sahayak", session_service=sess1)
+    sess2 = InMemorySessionService()
+    await sess2.create_session(app_name="ask-sahayak", user_id="u", state={"history": HISTORY, **SLOTS})
+    Runner(agent=seq, app_name="ask-sahayak", session_service=sess2)
+
+
+async def after(i: int, pool: RunnerPool) -> None:
+    pool.get("intent")
+    async with scratch_session("u", {}):
+        pass
+    # ten chat sessions taking turns
+    await session_store.acquire("u", f"chat-{i % 10}", HISTORY, SLOTS)
+    pool.get("explanation")
+
+
+async def measure(fn, n: int) -> list:
+    out = []
+    for i in range(n):
+        t0 = time.perf_counter()
+        await fn(i)
+        out.append((time.perf_counter() - t0) * 1e6)
+    return out
+
+
+def report(name: str, samples: list) -> None:
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{name:<7} mean={statistics.mean(samples):9.1f}µs  p50={statistics.median(samples):9.1f}µs  p95={p95:9.1f}µs")
+
+
+async def main(n: int) -> None:
+    t0 = time.perf_counter()
+    pool = RunnerPool({"intent": intent, "explanation": seq})
+    print(f"pool warm-up (one-off): {(time.perf_counter() - t0) * 1e6:.1f}µs")
+    report("before", await measure(before, n))
+    report("after", await measure(lambda i: after(i, pool), n))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
@@ -0,0 +1,122 @@
+# scripts/firestore_roundtrips.py
+"""
+Firestore round trips and latency per endpoint, against the local emulator.
+
+Drives the resource endpoints through the app (Cloud Storage replaced by an
+in-memory bucket, auth by a fixed user) and a chat turn through the
+router's ChatHistory, and reports for each the Firestore calls made per
+request, by method, as counted on the app's shared client.
+
+Start the emulator first, e.g.
+  gcloud emulators firestore start --host-port=localhost:8080
+  export FIRESTORE_EMULATOR_HOST=localhost:8080
+
+Usage:
+  python -m scripts.firestore_roundtrips [iterations]
+"""
+
+import os
+import sys
+import time
+import uuid
+import asyncio
+import statistics
+from collections import Counter
+
+if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+    sys.exit("Set FIRESTORE_EMULATOR_HOST to a running Firestore emulator (see the module docstring).")
+os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "demo-sahayak")
+os.environ.setdefault("GOOGLE_CLOUD_LOCATION", "us-central1")
+os.environ.setdefault("CLIENTS_WARM", "off")
+os.environ.setdefault("CHAT_HISTORY_LIMIT", "1000")  # keeps history summaries (model calls) out of the run
+
+from fastapi.testclient import TestClient
+
+from app import datastore
+from app.deps import get_bucket, get_current_user
+from app.main import app
+import app.routers.agents as agents
+
+
+class _Blob:
+    def __init__(self, store, path):
+        self._store, self._path = store, path
+
+    def upload_from_file(self, f, rewind=False, size=None, content_type=None):
+        if rewind:
+            f.seek(0)
+        self._store[self._path] = f.read()
+
+    def delete(self):
+        self._store.pop(self._path, None)
+
+    def generate_signed_url(self, expiration=None):
+        return f"https://storage.invalid/{self._path}"
+
+
+class _Bucket:
+    """Cloud Storage stand-in, so only Firestore is measured."""
+
+    def __init__(self):
+        self.blobs = {}
+
+    def blob(self, path, chunk_size=None):
+        return _Blob(self.blobs, path)
+
+
+def _publish(client: TestClient) -> str:
+    r = client.post("/api/resources", data={
+        "title": "Fractions", "type": "worksheet", "tags": "maths,grade-5",
+        "payload": '{"worksheets": [{"level": "core", "answers": ["B", "3/4"]}]}',
+    }, files=[("files", ("core.pdf", b"%PDF-1.4", "application/pdf"))])
+    r.raise_for_status()
+    return r.json()["id"]
+
+
+_loop = asyncio.new_event_loop()  # ChatHistory's background writes live on one loop
+
+
+def _chat_turn(sid: str) -> None:
+    async def turn():
+        await agents.chat_history.open_turn(sid, "Explain photosynthesis")
+        agents.chat_history.close_turn(sid, "Plants make food from light.")
+        await agents.chat_history.drain()
+    _loop.run_until_complete(turn())
+
+
+def measure(name: str, fn, n: int) -> None:
+    times, trips = [], Counter()
+    for _ in range(n):
+        before = Counter(datastore.round_trips())
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1e3)
+        trips += Counter(datastore.round_trips()) - before
+    per_call = sum(trips.values()) / n
+    methods = ", ".join(f"{m}={c / n:g}" for m, c in sorted(trips.items()))
+    print(f"{name:<34} {per_call:5.1f} rt/req  mean={statistics.mean(times):7.1f}ms  p50={statistics.median(times):7.1f}ms  [{methods}]")
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    app.dependency_overrides[get_bucket] = lambda: _Bucket()
+    app.dependency_overrides[get_current_user] = lambda: {"uid": "roundtrip-user"}
+    client = TestClient(app)
+
+    ids = [_publish(client) for _ in range(10)]
+    page = client.get("/api/resources", params={"limit": 5})
+    cursor = page.headers.get("X-Next-Cursor")
+    cached_sid = str(uuid.uuid4())
+    _chat_turn(cached_sid)
+
+    print(f"Firestore emulator at {os.environ['FIRESTORE_EMULATOR_HOST']}, {datastore.CHANNELS} channel(s), {n} requests each\n")
+    measure("POST /resources", lambda: _publish(client), n)
+    measure("GET /resources?limit=5", lambda: client.get("/api/resources", params={"limit": 5}), n)
+    measure("GET /resources?limit=5&cursor=…", lambda: client.get("/api/resources", params={"limit": 5, "cursor": cursor}), n)
+    measure("GET /resources/{id}", lambda: client.get(f"/api/resources/{ids[0]}"), n)
+    measure("chat turn, new session", lambda: _chat_turn(str(uuid.uuid4())), n)
+    measure("chat turn, cached session", lambda: _chat_turn(cached_sid), n)
+
+
+if __name__ == "__main__":
+    main()
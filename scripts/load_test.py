@@ -0,0 +1,83 @@
+# scripts/load_test.py
+"""
+Closed-loop load test: for each concurrency level, N workers fire requests
+back-to-back at one endpoint and we report throughput and latency. With
+blocking calls off the event loop, req/s should keep rising with
+concurrency until the per-client executor limits (app/concurrency.py)
+are reached.
+
+Usage:
+  python -m scripts.load_test --base http://localhost:8080 \
+      --endpoint mindmap --levels 1,2,4,8,16 --requests 32
+"""
+
+import time
+import asyncio
+import argparse
+import statistics
+
+import httpx
+
+PAYLOADS = {
+    "health":  ("GET",  "/health", None),
+    "ask":     ("POST", "/api/agents/ask-sahayak", {"prompt": "Explain photosynthesis for grade 5"}),
+    "mindmap": ("POST", "/api/agents/mindmap-generator", {"text": "Water cycle", "grade": 5, "subject": "Science"}),
+    "diagram": ("POST", "/api/agents/diagram-generator", {"prompt": "Parts of a flower", "diagram_type": "line-art", "grade": 5}),
+    "resources": ("GET", "/api/resources", None),
+}
+
+
+async def run_level(client: httpx.AsyncClient, endpoint: str, concurrency: int, total: int) -> dict:
+    method, path, body = PAYLOADS[endpoint]
+    latencies, errors = [], 0
+    remaining = total
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            t0 = time.perf_counter()
+            try:
+                r = await client.request(method, path, json=body)
+                if r.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - t0
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / wall,
+        "p50": statistics.median(latencies),
+        "p95": latencies[max(0, int(len(latencies) * 0.95) - 1)],
+    }
+
+
+async def main(args) -> None:
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=max(args.levels) * 2)
+    async with httpx.AsyncClient(base_url=args.base, headers=headers, timeout=timeout, limits=limits) as client:
+        print(f"{'conc':>5} {'reqs':>5} {'err':>4} {'req/s':>8} {'p50 s':>8} {'p95 s':>8}")
+        for level in args.levels:
+            r = await run_level(client, args.endpoint, level, max(args.requests, level))
+            print(f"{r['concurrency']:>5} {r['requests']:>5} {r['errors']:>4} "
+                  f"{r['rps']:>8.2f} {r['p50']:>8.2f} {r['p95']:>8.2f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--base", default="http://localhost:8080")
+    ap.add_argument("--endpoint", choices=sorted(PAYLOADS), default="mindmap")
+    ap.add_argument("--levels", type=lambda s: [int(x) for x in s.split(",")], default=[1, 2, 4, 8, 16])
+    ap.add_argument("--requests", type=int, default=32, help="requests per concurrency level")
+    ap.add_argument("--token", default="", help="Firebase ID token; omit for the dev-user fallback")
+    ap.add_argument("--timeout", type=float, default=120.0)
+    asyncio.run(main(ap.parse_args()))
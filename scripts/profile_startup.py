@@ -0,0 +1,109 @@
+# scripts/profile_startup.py
+"""
+Import-time and startup profile of the app.
+
+Imports app.main in a fresh interpreter under `python -X importtime` and
+reports the wall time, the slowest modules (cumulative and self) and the
+self time per top-level package. With --warm it then builds every client
+in app.clients concurrently, as the startup hook does, and reports each
+one's init time; that part needs the same credentials as the app.
+
+For CI, --budget-ms fails the run (exit 1) when importing app.main takes
+longer than the budget, and --json prints the report as JSON.
+
+Usage:
+  python -m scripts.profile_startup [--warm] [--top N] [--budget-ms MS] [--json]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+from collections import defaultdict
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def import_profile() -> dict:
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        capture_output=True, text=True, env={**os.environ, "CLIENTS_WARM": "off"},
+    )
+    wall_ms = (time.perf_counter() - t0) * 1e3
+    if proc.returncode != 0:
+        sys.exit(f"import app.main failed:\n{proc.stderr[-2000:]}")
+
+    modules = []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            modules.append({
+                "module": m.group(4),
+                "self_ms": int(m.group(1)) / 1e3,
+                "cumulative_ms": int(m.group(2)) / 1e3,
+                "depth": len(m.group(3)) // 2,
+            })
+    by_package = defaultdict(float)
+    for mod in modules:
+        by_package[mod["module"].split(".")[0]] += mod["self_ms"]
+    app_main = next((m["cumulative_ms"] for m in modules if m["module"] == "app.main"), None)
+    return {
+        "wall_ms": round(wall_ms, 1),
+        "import_app_main_ms": app_main,
+        "modules": modules,
+        "by_package": dict(sorted(by_package.items(), key=lambda kv: -kv[1])),
+    }
+
+
+def warm_profile() -> dict:
+    from app import clients
+
+    t0 = time.perf_counter()
+    per_client = asyncio.run(clients.warm())
+    return {"total_ms": round((time.perf_counter() - t0) * 1e3, 1), "clients": per_client}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--warm", action="store_true", help="also time client initialization")
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--budget-ms", type=float, help="fail if importing app.main takes longer")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    report = import_profile()
+    if args.warm:
+        report["warm"] = warm_profile()
+
+    if args.json:
+        report["modules"] = sorted(report["modules"], key=lambda m: -m["cumulative_ms"])[:args.top]
+        print(json.dumps(report, indent=2))
+    else:
+        mods = report["modules"]
+        print(f"import app.main: {report['import_app_main_ms']:.0f}ms (process wall {report['wall_ms']:.0f}ms)\n")
+        print("slowest imports (cumulative):")
+        for m in sorted(mods, key=lambda m: -m["cumulative_ms"])[:args.top]:
+            print(f"  {m['cumulative_ms']:9.1f}ms  {m['module']}")
+        print("\nslowest imports (self):")
+        for m in sorted(mods, key=lambda m: -m["self_ms"])[:args.top]:
+            print(f"  {m['self_ms']:9.1f}ms  {m['module']}")
+        print("\nself time by package:")
+        for pkg, ms in list(report["by_package"].items())[:args.top]:
+            print(f"  {ms:9.1f}ms  {pkg}")
+        if args.warm:
+            print(f"\nclients warmed in {report['warm']['total_ms']:.0f}ms:")
+            for name, ms in report["warm"]["clients"].items():
+                print(f"  {ms if isinstance(ms, str) else f'{ms:9.1f}ms'}  {name}")
+
+    if args.budget_ms is not None and (report["import_app_main_ms"] or 0) > args.budget_ms:
+        print(f"\nimport app.main took {report['import_app_main_ms']:.0f}ms, over the {args.budget_ms:.0f}ms budget", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()